@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class StiCazziConfig(AppConfig):
+    name = 'StiCazzi'
+
+    def ready(self):
+        # Connect the denormalization signal handlers
+        from StiCazzi import signals
@@ -0,0 +1,85 @@
+"""
+    iCarusi BE - Verified credentials cache
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from StiCazzi.env import AUTH_CACHE_TTL, AUTH_CACHE_SIZE
+
+
+class VerifiedCredentialsCache:
+    """
+    Bounded LRU of (username, token digest) pairs that already passed check_password.
+    An entry is only valid for the stored rosebud_uid hash and timestamp it was verified
+    against, so a token rotation invalidates it even before the TTL expires.
+    """
+
+    def __init__(self, ttl=AUTH_CACHE_TTL, max_size=AUTH_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(username, rosebud_uid):
+        digest = hashlib.sha256(str(rosebud_uid).encode('utf-8')).hexdigest()
+        return (username, digest)
+
+    @staticmethod
+    def _fingerprint(user):
+        return (user.rosebud_uid, user.rosebud_uid_ts)
+
+    def is_verified(self, user, rosebud_uid):
+        """ True if the token has been recently verified for the current user state """
+        if not self.ttl or not rosebud_uid:
+            return False
+
+        key = self._key(user.username, rosebud_uid)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now and entry[1] == self._fingerprint(user):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+        return False
+
+    def remember(self, user, rosebud_uid):
+        """ Store a successful verification """
+        if not self.ttl or not rosebud_uid:
+            return
+
+        key = self._key(user.username, rosebud_uid)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, self._fingerprint(user))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        """ Drop every entry of a user, e.g. after a token rotation """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == username]:
+                del self._entries[key]
+
+    def stats(self):
+        """ Hit/miss counters """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_ratio': float(self.hits) / total if total else 0.0
+            }
+
+
+verified_credentials = VerifiedCredentialsCache()
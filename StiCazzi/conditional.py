@@ -0,0 +1,39 @@
+"""
+    iCarusi BE - ETag / If-None-Match support for read mostly endpoints
+"""
+
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+
+def generation_etag(name, generation, *parts):
+    """ Strong ETag of a response built from data at the given generation, None if unknown """
+    if generation is None:
+        return None
+    digest = hashlib.sha1(repr((name, generation) + parts).encode('utf-8')).hexdigest()
+    return quote_etag(digest)
+
+
+def is_not_modified(request, etag):
+    """ True if the client already holds the response tagged etag """
+    if etag is None:
+        return False
+    # A rotated token has to reach the client with the full response
+    if getattr(request, 'rosebud_rotated', False):
+        return False
+    client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return etag in client_etags or '*' in client_etags
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def with_etag(response, etag):
+    if etag is not None:
+        response['ETag'] = etag
+    return response
@@ -16,16 +16,12 @@ import Padding
 import requests
 from requests.auth import HTTPBasicAuth
 
-import firebase_admin
-from firebase_admin import credentials, auth
 from geopy.distance import geodesic
 from geopy.geocoders import Nominatim
 import git
 
-from google.oauth2 import id_token as google_id_token
-from google.auth.transport import requests as google_requests
-
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
+from django.db.models import Q
 from django.contrib.auth.hashers import check_password, make_password
 from django.core import serializers
 from django import get_version
@@ -34,9 +30,19 @@ from django.contrib.auth import authenticate
 from StiCazzi.models import Pesata, Soggetto, Song, Lyric, Movie, User, Session, Location, Configuration, Notification
 from StiCazzi.models import ConfigurationSerializer
 from StiCazzi.env import MONGO_API_URL, MONGO_API_USER, MONGO_API_PWD, MONGO_SERVER_CERTIFICATE, MAX_FILE_SIZE
+from StiCazzi.env import SESSION_VALIDITY_HOURS, SESSION_CLOCK_SKEW_HOURS, SESSION_AUDIT, FEED_PAGE_SIZE
+from StiCazzi.auth_cache import verified_credentials
+from StiCazzi.replay import replay_window
+from StiCazzi.middleware import get_payload
+from StiCazzi.write_behind import user_writes
+from StiCazzi.id_tokens import google_id_tokens, get_firebase_id_tokens
+from StiCazzi.generation import tvshow_pages, configuration_generation
+from StiCazzi.conditional import generation_etag, is_not_modified, not_modified, with_etag
+from StiCazzi.notifications import coalesce_key, save_notifications
 from . import utils
 
 SESSION_DBG = False
+ROSEBUD_HASHER = 'rosebud_hmac'
 logger = logging.getLogger(__name__)
 
 def get_demo_json(request):
@@ -57,17 +63,13 @@ def get_random_song(request):
     response_data = {}
     response_data['result'] = 'success'
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        kanazzi = i_data.get('kanazzi', '')
-    except ValueError:
-        response['result'] = 'failure'
-        response['message'] = 'Bad input format'
-        return JsonResponse(response, status=400)
+    if not get_payload(request).valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
 
     # CHECK SESSION - SOFT VERSION - NO SAVE ON DB
-    if not check_session(kanazzi, username, action='getRandomSong', store=False):
+    if not check_request_session(request, action='getRandomSong', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -228,27 +230,39 @@ def get_sum_by_month(request):
     return JsonResponse(response_data)
 
 
+def make_rosebud_uid(token):
+    """ Hash a rosebud uid with the dedicated token hasher """
+    return make_password(str(token), hasher=ROSEBUD_HASHER)
+
+
+def check_rosebud_uid(current_user, rosebud_uid):
+    """ Verify the rosebud uid, skipping the hasher on recently verified tokens """
+    if verified_credentials.is_verified(current_user, rosebud_uid):
+        return True
+
+    def upgrade_rosebud_uid(raw_token):
+        # Legacy PBKDF2 hashes are migrated on the first successful check
+        logger.debug("Upgrading rosebud uid hash for user [%s]" % current_user.username)
+        current_user.rosebud_uid = make_rosebud_uid(raw_token)
+        current_user.save(update_fields=['rosebud_uid'])
+
+    if check_password(rosebud_uid, current_user.rosebud_uid, setter=upgrade_rosebud_uid, preferred=ROSEBUD_HASHER):
+        verified_credentials.remember(current_user, rosebud_uid)
+        return True
+
+    return False
+
+
 def check_session_ng(request):
 
     result = {"success":False, "new_token":""}
 
-    #backward compatibility - will be removed soon
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
-    rosebud_uid = request.POST.get('rosebud_uid', '')
-    app_version = request.POST.get('app_version', '')
-    #end backward compatibility - will be removed soon
-
-    if not username:
-        try:
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            kanazzi = i_data.get('kanazzi', '')
-            rosebud_uid = i_data.get('rosebud_uid', '')
-            app_version = i_data.get('app_version', '')
-        except ValueError:
-            result['message'] = 'Invalid data'
-            return result
+    payload = get_payload(request)
+    if not payload.valid:
+        result['message'] = 'Invalid data'
+        return result
+
+    username, kanazzi, rosebud_uid, app_version = payload.credentials
 
     users = User.objects.filter(username=username)
     current_user = users.first()
@@ -256,10 +270,9 @@ def check_session_ng(request):
     #logger.debug("App Version %s" % app_version)
     logger.debug(rosebud_uid)
     logger.debug("="*30)
-    if app_version and app_version != current_user.app_version:
-        current_user.app_version = app_version
-        current_user.save()
-    if check_password(rosebud_uid, current_user.rosebud_uid):
+    if app_version:
+        user_writes.defer(current_user, app_version=app_version)
+    if check_rosebud_uid(current_user, rosebud_uid):
         logger.debug("Auth NG successful")
         result['success'] = True
 
@@ -281,9 +294,10 @@ def check_session_ng(request):
         logger.debug("Session time : %1.3f hours" % time_diff_hrs)
         if time_diff_hrs > 3:  # Expired after two hours (actually one becasue aws timezone)
             new_token = uuid.uuid4()
-            current_user.rosebud_uid = make_password(str(new_token))
+            current_user.rosebud_uid = make_rosebud_uid(new_token)
             current_user.rosebud_uid_ts = datetime.now()
-            current_user.save()
+            current_user.save(update_fields=['rosebud_uid', 'rosebud_uid_ts', 'updated'])
+            verified_credentials.invalidate(current_user.username)
             result['new_token'] = new_token
     else:
         logger.debug("Auth NG failed!")
@@ -301,25 +315,14 @@ def authentication(fn):
         result = {"success":False, "new_token":"", "code": 401}
         request = args[0]
 
-        #backward compatibility - will be removed soon
-        username = request.POST.get('username', '')
-        kanazzi = request.POST.get('kanazzi', '').strip()
-        rosebud_uid = request.POST.get('rosebud_uid', '')
-        app_version = request.POST.get('app_version', '')
-        #end backward compatibility - will be removed soon
-
-        if not username:
-            try:
-                i_data = json.loads(request.body)
-                username = i_data.get('username', '')
-                kanazzi = i_data.get('kanazzi', '')
-                rosebud_uid = i_data.get('rosebud_uid', '')
-                app_version = i_data.get('app_version', '')
-                logger.debug("Authentication [%s] [%s]" % (request.path, username))
-            except ValueError:
-                result['message'] = 'Invalid data'
-                result['code'] = 400
-                return JsonResponse(result, status=result['code'])
+        payload = get_payload(request)
+        if not payload.valid:
+            result['message'] = 'Invalid data'
+            result['code'] = 400
+            return JsonResponse(result, status=result['code'])
+
+        username, kanazzi, rosebud_uid, app_version = payload.credentials
+        logger.debug("Authentication [%s] [%s]" % (request.path, username))
 
         users = User.objects.filter(username=username)
         current_user = users.first()
@@ -331,11 +334,10 @@ def authentication(fn):
         #logger.debug(rosebud_uid)
         #logger.debug("="*30)
 
-        if app_version and app_version != current_user.app_version:
-            current_user.app_version = app_version
-            current_user.save()
+        if app_version:
+            user_writes.defer(current_user, app_version=app_version)
 
-        if check_password(rosebud_uid, current_user.rosebud_uid):
+        if check_rosebud_uid(current_user, rosebud_uid):
             logger.debug("Authentication Successful [%s] [%s]" % (request.path, username))
             result['success'] = True
 
@@ -357,18 +359,23 @@ def authentication(fn):
             logger.debug("Session time : %1.3f hours" % time_diff_hrs)
             if time_diff_hrs > 3:  # Expired after two hours (actually one becasue aws timezone)
                 new_token = uuid.uuid4()
-                current_user.rosebud_uid = make_password(str(new_token))
+                current_user.rosebud_uid = make_rosebud_uid(new_token)
                 current_user.rosebud_uid_ts = datetime.now()
-                current_user.save()
+                current_user.save(update_fields=['rosebud_uid', 'rosebud_uid_ts', 'updated'])
+                verified_credentials.invalidate(current_user.username)
                 result['new_token'] = new_token
+                request.rosebud_rotated = True
                 logger.debug("New token created for user [%s]" % current_user.username)
             result['code'] = 200
             result['payload'] = fn(*args, **kwargs)
+            # e.g. 304 Not Modified
+            if isinstance(result['payload'], HttpResponse):
+                return result['payload']
         else:
             logger.debug("Authentication Failed [%s] [%s]" % (request.path, username))
             result['payload'] = {}
 
-        return JsonResponse(result, status=result['code'])
+        return with_etag(JsonResponse(result, status=result['code']), getattr(request, 'response_etag', None))
 
     return wrapper_fn
 
@@ -392,8 +399,8 @@ def check_session(session_id, username, action='', store=False):
 
     logger.debug("Session check [%s] [%s]" % (action, username))
     session_id = session_id.strip()
-    sessions = Session.objects.filter(session_string=session_id)
-    if sessions:
+    # Answered from memory, with store=True the INSERT of replay_window.add() is the authoritative check
+    if replay_window.seen(session_id):
         #print "session already exists"
         logger.debug("Session already exist")
         return False
@@ -414,10 +421,15 @@ def check_session(session_id, username, action='', store=False):
         time_diff = now - session_dt
         time_diff_hrs = time_diff.total_seconds() / 3600
         #logger.debug("Session time : %1.3f hours" % time_diff_hrs)
-        if time_diff_hrs > 3:  # Expired after two hours (actually one becasue aws timezone)
+        if time_diff_hrs > SESSION_VALIDITY_HOURS:  # Expired after two hours (actually one becasue aws timezone)
             if SESSION_DBG:
                 logger.debug("Session expired : %.3f hours" % time_diff_hrs)
             return False
+        # A token from the future would outlive its replay record
+        if time_diff_hrs < -SESSION_CLOCK_SKEW_HOURS:
+            if SESSION_DBG:
+                logger.debug("Session from the future : %.3f hours" % time_diff_hrs)
+            return False
 
         if SESSION_DBG:
             logger.debug("Session not expired : %.3f hours" % time_diff_hrs) 
@@ -429,12 +441,23 @@ def check_session(session_id, username, action='', store=False):
         return False
 
     if store:
-        session = Session(session_string=session_id, username=username, action=action)
-        session.save()
+        stored = replay_window.add(session_id)
+        if stored is False:
+            logger.debug("Session already exist")
+            return False
+        if SESSION_AUDIT:
+            session = Session(session_string=session_id, username=username, action=action)
+            session.save()
 
     return True
 
 
+def check_request_session(request, action='', store=False):
+    """ check_session with the credentials of the request payload """
+    credentials = get_payload(request).credentials
+    return check_session(credentials.kanazzi, credentials.username, action=action, store=store)
+
+
 def login(request):
     """
     Controller:
@@ -444,19 +467,12 @@ def login(request):
     response_data['result'] = 'success'
     logged = "no"
     try:
-        #backward compatibility
-        username = request.POST.get('username', '')
-        password = request.POST.get('password', '')
-        #end backward compatibility
-
-        if not username:
-            try:
-                i_data = json.loads(request.body)
-                username = i_data.get('username', '')
-                password = i_data.get('password', '')
-                logger.debug("New login have been used")
-            except ValueError:
-                response_data['message'] = 'Invalid data'
+        payload = get_payload(request)
+        if not payload.valid:
+            response_data['message'] = 'Invalid data'
+
+        username = payload.get('username', '')
+        password = payload.get('password', '')
 
         if not username or not password:
             response_data['result'] = 'failure'
@@ -479,9 +495,10 @@ def login(request):
             if pwd_ok:
                 logged = "yes"
                 current_user = users.first()
-                current_user.rosebud_uid = make_password(str(rosebud_uid))
+                current_user.rosebud_uid = make_rosebud_uid(rosebud_uid)
                 current_user.rosebud_uid_ts = datetime.now()
-                current_user.save()
+                current_user.save(update_fields=['rosebud_uid', 'rosebud_uid_ts', 'updated'])
+                verified_credentials.invalidate(current_user.username)
                 extra_info['poweruser'] = current_user.poweruser
                 extra_info['geoloc_enabled'] = current_user.geoloc_enabled
 
@@ -513,18 +530,18 @@ def login2(request):
 
     response = {'result':'success','payload':{}}
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        email = i_data.get('email', '')
-        firebase_id_token = i_data.get('firebase_id_token', '')
-        app_version = i_data.get('app_version', '')
-        fcm_token = i_data.get('fcm_token', '')
-    except ValueError:
+    payload = get_payload(request)
+    if not payload.valid:
         response['result'] = 'failure'
         response['message'] = 'Bad input format'
         return JsonResponse(response, status=400)
 
+    username = payload.get('username', '')
+    email = payload.get('email', '')
+    firebase_id_token = payload.get('firebase_id_token', '')
+    app_version = payload.get('app_version', '')
+    fcm_token = payload.get('fcm_token', '')
+
     token_check = check_google(firebase_id_token)
 
     if not username or not token_check['result']:
@@ -537,7 +554,7 @@ def login2(request):
     if user:
         user.email = email
         user.firebase_id_token = firebase_id_token
-        user.save()
+        user.save(update_fields=['email', 'firebase_id_token', 'updated'])
         logger.debug("Existing user logged in: %s", email)
         response['payload']['new_user'] = False
     else:
@@ -580,17 +597,15 @@ def django_login(request):
 
     response = {'result':'success','payload':{}}
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        password = i_data.get('password', '')
-        firebase_id_token = i_data.get('firebase_id_token', '')
-        app_version = i_data.get('app_version', '')
-    except ValueError:
+    payload = get_payload(request)
+    if not payload.valid:
         response['result'] = 'failure'
         response['message'] = 'Bad input format'
         return JsonResponse(response, status=400)
 
+    username = payload.get('username', '')
+    password = payload.get('password', '')
+
     #token_check = check_google(firebase_id_token)
     return auth(username, password, request)
 
@@ -609,31 +624,18 @@ def geolocation(request):
     }
     ret_status = 200
 
-    # TO BE REMOVED
-    username = request.POST.get('username', '')
-    longitude = request.POST.get('longitude', '')
-    latitude = request.POST.get('latitude', '')
-    photo = request.POST.get('photo', '')
-    action = request.POST.get('action', '')
-    notification_on = request.POST.get('notification_on', False)
-    kanazzi = request.POST.get('kanazzi', '').strip()
-
-    if not username:
-        try:
-            logger.debug("New post method used")
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            longitude = i_data.get('longitude', '')
-            latitude = i_data.get('latitude', '')
-            photo = i_data.get('photo', '')
-            action = i_data.get('action', '')
-            notification_on = i_data.get('notification_on', False)
-            kanazzi = i_data.get('kanazzi', '').strip()
-        except ValueError as e:
-            response['result'] = 'failure'
-            response['message'] = 'Bad input format'
-            logger.error(e)
-            return JsonResponse(response, status=400)
+    payload = get_payload(request)
+    if not payload.valid:
+        response['result'] = 'failure'
+        response['message'] = 'Bad input format'
+        return JsonResponse(response, status=400)
+
+    username = payload.credentials.username
+    longitude = payload.get('longitude', '')
+    latitude = payload.get('latitude', '')
+    photo = payload.get('photo', '')
+    action = payload.get('action', '')
+    notification_on = payload.get('notification_on', False)
 
     logger.debug("Action: %s" % action)
     logger.debug("Notification On: %s" % notification_on)
@@ -643,7 +645,7 @@ def geolocation(request):
     else:
         notification_on = False
 
-    if not check_session(kanazzi, username, action='geolocation', store=True):
+    if not check_request_session(request, action='geolocation', store=True):
         response['result'] = 'failure'
         response['message'] = 'Invalid Session'
         return JsonResponse(response, status=401)
@@ -742,8 +744,9 @@ def geolocation(request):
                         type="new_location", \
                         title=notif_title, \
                         message=message, \
-                        username=users[0].username)
-                    notification.save()
+                        username=users[0].username,
+                        coalesce_key=coalesce_key("new_location", users[0].username))
+                    save_notifications([notification])
 
             else:
                 location = Location(user=users[0], latitude=latitude, longitude=longitude, photo=photo)
@@ -765,23 +768,20 @@ def geolocation2(request):
 
     response = {'result':'success'}
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        action = i_data.get('action', '')
-        longitude = i_data.get('longitude', '')
-        latitude = i_data.get('latitude', '')
-        photo = i_data.get('photo', '')
-        firebase_id_token = i_data.get('firebase_id_token', '')
-        kanazzi = i_data.get('kanazzi', '')
-    except ValueError:
+    payload = get_payload(request)
+    if not payload.valid:
         response['result'] = 'failure'
         response['message'] = 'Bad input format'
         return JsonResponse(response, status=400)
 
+    username = payload.credentials.username
+    action = payload.get('action', '')
+    longitude = payload.get('longitude', '')
+    latitude = payload.get('latitude', '')
+
     # logger.debug("Checking firebase id token.... Result: " + str(check_fb_token_local(firebase_id_token)))
 
-    if not check_session(kanazzi, username, action='geolocation2', store=True):
+    if not check_request_session(request, action='geolocation2', store=True):
         response['result'] = 'failure'
         response['message'] = 'Invalid Session'
         return JsonResponse(response, status=401)
@@ -841,27 +841,27 @@ def set_fb_token(request):
     # logger.debug(request.content_type)
     # logger.debug(" =========================")
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        token = i_data.get('token', '')
-        id_token = i_data.get('id_token', '')
-        app_version = i_data.get('app_version', '')
-    except ValueError:
+    payload = get_payload(request)
+    if not payload.valid:
         response['result'] = 'failure'
         response['message'] = 'Bad input format'
         return JsonResponse(response, status=400)
 
+    username = payload.get('username', '')
+    token = payload.get('token', '')
+    id_token = payload.get('id_token', '')
+    app_version = payload.get('app_version', '')
+
     if username:
         users = User.objects.filter(username=username)
         if users:
             user = users[0]
-            user.app_version = app_version
+            user_writes.defer(user, app_version=app_version)
             if token:
-                user.fcm_token = token
+                user_writes.defer(user, fcm_token=token)
             if id_token:
                 user.firebase_id_token = id_token
-            user.save()
+                user.save(update_fields=['firebase_id_token', 'updated'])
             return JsonResponse(response, status=200)
 
     response['result'] = 'failure'
@@ -872,21 +872,19 @@ def set_fb_token2(request):
     """
     Controller:
     """
-    from types import SimpleNamespace
     logger.debug("Set FB Token 2 called")
     response = {}
 
-    i_data = json.loads(request.body)
-    n = SimpleNamespace(**i_data)
-    users = User.objects.filter(username=n.username)
+    payload = get_payload(request)
+    users = User.objects.filter(username=payload.credentials.username)
     if users:
         user = users.first()
-        user.app_version = n.app_version
-        if n.token:
-            user.fcm_token = n.token
-        if n.firebase_id_token:
-            user.firebase_id_token = n.firebase_id_token
-        user.save()
+        user_writes.defer(user, app_version=payload.credentials.app_version)
+        if payload.get('token', ''):
+            user_writes.defer(user, fcm_token=payload.get('token', ''))
+        if payload.get('firebase_id_token', ''):
+            user.firebase_id_token = payload.get('firebase_id_token', '')
+            user.save(update_fields=['firebase_id_token', 'updated'])
 
     return response
 
@@ -898,21 +896,13 @@ def check_fb_token(request):
     response = {"result":"success", "message":""}
 
     try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
+        payload = get_payload(request)
+        if not payload.valid:
+            raise ValueError('Bad input format')
+        username = payload.get('username', '')
         if SESSION_DBG:
             logger.debug('Starting session check for user %s', username)
 
-
-        #Google Initializazion
-        google_account_file = os.environ.get('GOOGLE_JSON', '')
-        if not google_account_file:
-            raise ValueError('Google JSON account file not found.')
-
-        if not firebase_admin._apps:
-            cred = credentials.Certificate(google_account_file)
-            default_app = firebase_admin.initialize_app(cred)
-
         #Retrieving id_token from DB
         users = User.objects.filter(username=username)
         if not users:
@@ -923,7 +913,7 @@ def check_fb_token(request):
             raise ValueError('idToken is empty!')
 
         #Verifying id token
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = get_firebase_id_tokens().verify(id_token)
 
         response["message"] = "Firebase idToken successulfy verified"
         response["payload"] = {"firebase_id_token":id_token}
@@ -952,17 +942,8 @@ def check_fb_token_local(id_token):
         if SESSION_DBG:
             logger.debug('Starting firebase id token check...')
 
-        #Google Initializazion
-        google_account_file = os.environ.get('GOOGLE_JSON', '')
-        if not google_account_file:
-            raise ValueError('Google JSON account file not found.')
-
-        if not firebase_admin._apps:
-            cred = credentials.Certificate(google_account_file)
-            default_app = firebase_admin.initialize_app(cred)
-
         #Verifying id token
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = get_firebase_id_tokens().verify(id_token)
 
         response = True
 
@@ -980,17 +961,13 @@ def check_google(token):
 
     try:
         if token:
-            # Specify the CLIENT_ID of the app that accesses the backend:
-            idinfo = google_id_token.verify_oauth2_token(token, google_requests.Request())
+            # Signing keys and decoded claims are cached, issuer is checked by the verifier
+            idinfo = google_id_tokens.verify(token)
 
-            # Or, if multiple clients access the backend server:
-            # idinfo = google_id_token.verify_oauth2_token(token, requests.Request())
+            # If multiple clients access the backend server:
             # if idinfo['aud'] not in [CLIENT_ID_1, CLIENT_ID_2, CLIENT_ID_3]:
             #     raise ValueError('Could not verify audience.')
 
-            if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
-                raise ValueError('Wrong issuer.')
-
             # If auth request is from a G Suite domain:
             # if idinfo['hd'] != GSUITE_DOMAIN_NAME:
             #     raise ValueError('Wrong hosted domain.')
@@ -1013,17 +990,15 @@ def test_session(request):
 
     response = {'result':'success'}
 
-    try:
-        i_data = json.loads(request.body)
-        #logger.debug("Valid JSON data received.")
-        username = i_data.get('username', '')
-        firebase_id_token = i_data.get('firebase_id_token', '')
-        kanazzi = i_data.get('kanazzi', '')
-    except ValueError:
+    payload = get_payload(request)
+    if not payload.valid:
         response['result'] = 'failure'
         response['message'] = 'Bad input format'
         return JsonResponse(response, status=400)
 
+    username = payload.get('username', '')
+    firebase_id_token = payload.get('firebase_id_token', '')
+
     token_check = check_google(firebase_id_token)
     # user_check = check_session(kanazzi, username, action='test_session', store=True)
 
@@ -1068,6 +1043,8 @@ def version(request):
 
     response['django'] = current_version
     response['mongo'] = mongoapi_version
+    response['auth_cache'] = verified_credentials.stats()
+    response['tvshows_cache'] = tvshow_pages.stats()
     return response
 
 
@@ -1076,21 +1053,12 @@ def get_configs(request):
     logger.debug("get configurations called")
     response_data = {}
 
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
-    
-    #backward compatibility - will be removed soon
-    if not username:
-        try:
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            kanazzi = i_data.get('kanazzi', '')
-        except ValueError:
-            response_data['result'] = 'failure'
-            response_data['message'] = 'Bad input format'
-            return JsonResponse(response_data, status=400)
+    if not get_payload(request).valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
 
-    if not username or not check_session(kanazzi, username, action='getConfig', store=False):
+    if not check_request_session(request, action='getConfig', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -1108,6 +1076,11 @@ def get_configs_new(request):
     """ Get Configurations """
     logger.debug("get configurations new called")
 
+    etag = generation_etag('configs', configuration_generation.get())
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    request.response_etag = etag
+
     configs = Configuration.objects.all()
     serializer = ConfigurationSerializer(configs, many=True)
     return serializer.data
@@ -1122,16 +1095,16 @@ def comfortably_numb(request):
 
     response = {'result':'success','payload':{}}
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        password = i_data.get('password', '')
-        password2 = i_data.get('password2', '')
-    except ValueError:
+    payload = get_payload(request)
+    if not payload.valid:
         response['result'] = 'failure'
         response['message'] = 'Bad input format'
         return JsonResponse(response, status=400)
 
+    username = payload.get('username', '')
+    password = payload.get('password', '')
+    password2 = payload.get('password2', '')
+
     if not username or not password:
         response['result'] = 'failure'
         response['payload'] = {"message": "Not valid credentials", 'logged':'no'}
@@ -1152,3 +1125,52 @@ def comfortably_numb(request):
 
     return JsonResponse(response)
 
+
+def get_feed(request):
+    """
+    Controller: notifications after the cursor, oldest first.
+    Without a cursor the latest ones are returned. next_cursor is the
+    cursor to send on the next poll.
+    """
+    response = {'result': 'success'}
+
+    payload = get_payload(request)
+    if not payload.valid:
+        response['result'] = 'failure'
+        response['message'] = 'Bad input format'
+        return JsonResponse(response, status=400)
+
+    cursor = payload.get('cursor', '')
+    try:
+        limit = min(max(int(payload.get('limit', FEED_PAGE_SIZE)), 1), FEED_PAGE_SIZE)
+        cursor_created, cursor_id = utils.decode_cursor(cursor, datetime, int) if cursor else (None, None)
+    except ValueError:
+        response['result'] = 'failure'
+        response['message'] = 'Bad cursor'
+        return JsonResponse(response, status=400)
+
+    # Polled often: the session check does not write a Session row
+    if not check_request_session(request, action='getfeed', store=False):
+        response['result'] = 'failure'
+        response['message'] = 'Invalid Session'
+        return JsonResponse(response, status=401)
+
+    fields = ('id_notification', 'type', 'title', 'message', 'username', 'created')
+    if cursor:
+        # notif_feed_idx range scan, a single probe when nothing is new
+        items = list(Notification.objects.filter(Q(created__gt=cursor_created) |
+                                                 Q(created=cursor_created, id_notification__gt=cursor_id))
+                                         .order_by('created', 'id_notification')
+                                         .values(*fields)[:limit + 1])
+        has_more = len(items) > limit
+        items = items[:limit]
+    else:
+        items = list(Notification.objects.order_by('-created', '-id_notification').values(*fields)[:limit])[::-1]
+        has_more = False
+
+    next_cursor = cursor
+    if items:
+        next_cursor = utils.encode_cursor(items[-1]['created'], items[-1]['id_notification'])
+
+    response['payload'] = {'items': items, 'next_cursor': next_cursor, 'has_more': has_more}
+    return JsonResponse(response)
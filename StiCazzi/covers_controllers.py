@@ -12,7 +12,9 @@ from requests.auth import HTTPBasicAuth
 from django.http import JsonResponse
 
 from StiCazzi.models import Notification
-from StiCazzi.controllers import check_session, check_google
+from StiCazzi.notifications import save_notifications
+from StiCazzi.controllers import check_session, check_request_session, check_google
+from StiCazzi.middleware import get_payload
 from StiCazzi.utils import safe_file_name
 from StiCazzi.env import MONGO_API_URL, MONGO_API_USER, MONGO_API_PWD, MONGO_SERVER_CERTIFICATE, MAX_FILE_SIZE
 
@@ -23,22 +25,12 @@ def get_random_cover(request):
     logger.debug("get_random_cover called")
     response_data = {}
 
-    # backward compatibility
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
-    # end backward compatibility
+    if not get_payload(request).valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
 
-    if not username:
-        try:
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            kanazzi = i_data.get('kanazzi', '')
-        except ValueError:
-            response_data['result'] = 'failure'
-            response_data['message'] = 'Bad input format'
-            return JsonResponse(response_data, status=400)
-
-    if not username or not kanazzi or not check_session(kanazzi, username, action='getRandomCover', store=False):
+    if not check_request_session(request, action='getRandomCover', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -62,10 +54,7 @@ def get_remote_covers(request):
     logger.debug("get_remote_covers called")
     response_data = {}
 
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
-
-    if not username or not kanazzi or not check_session(kanazzi, username, action='getRemoteCovers', store=False):
+    if not check_request_session(request, action='getRemoteCovers', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -88,17 +77,15 @@ def spotify_auth(request):
     logger.debug("Spotify Auth Called")
     response_data = {}
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        kanazzi = i_data.get('kanazzi', '')
-        album_url = i_data.get('album_url', '')
-        query = i_data.get('query', '')
-        search_type = i_data.get('search_type', '')
-    except ValueError:
+    payload = get_payload(request)
+    if not payload.valid:
         response_data['result'] = 'failure'
         response_data['message'] = 'Bad input format'
         return JsonResponse(response_data, status=400)
+
+    album_url = payload.get('album_url', '')
+    query = payload.get('query', '')
+    search_type = payload.get('search_type', '')
    
     #logger.debug("%s - %s" % (username, kanazzi))
     logger.debug("%s - %s - %s" % (album_url, search_type, query))
@@ -108,7 +95,7 @@ def spotify_auth(request):
         response_data['message'] = 'Unprocessable Entity: missing parameter'
         return JsonResponse(response_data, status=422)
     
-    if not username or not kanazzi or not check_session(kanazzi, username, action='spotifyAuthorization', store=False):
+    if not check_request_session(request, action='spotifyAuthorization', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -206,23 +193,15 @@ def get_covers(request):
     """ Get all covers from API """
     response_data = {}
 
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
+    payload = get_payload(request)
+    if not payload.valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
+
+    limit = payload.get('limit', '15')
 
-    #backward compatibility - will be removed soon
-    if not username:
-    
-        try:
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            kanazzi = i_data.get('kanazzi', '')
-            limit = i_data.get('limit', '15')
-        except ValueError:
-            response_data['result'] = 'failure'
-            response_data['message'] = 'Bad input format'
-            return JsonResponse(response_data, status=400)
-
-    if not username or not kanazzi or not check_session(kanazzi, username, action='getCovers', store=False):
+    if not check_request_session(request, action='getCovers', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -248,23 +227,15 @@ def get_covers_ng(request):
     """ Get all covers from API """
     response_data = {}
 
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
+    payload = get_payload(request)
+    if not payload.valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
 
-    #backward compatibility - will be removed soon
-    if not username:
+    limit = payload.get('limit', '15')
 
-        try:
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            kanazzi = i_data.get('kanazzi', '')
-            limit = i_data.get('limit', '15')
-        except ValueError:
-            response_data['result'] = 'failure'
-            response_data['message'] = 'Bad input format'
-            return JsonResponse(response_data, status=400)
-
-    if not username or not kanazzi or not check_session(kanazzi, username, action='getCovers', store=False):
+    if not check_request_session(request, action='getCovers', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -317,23 +288,12 @@ def get_covers_stats(request):
     logger.debug("get_covers_stats called")
     response_data = {}
 
-    # backward compatibility - will be removed soon
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
-    # end backward compatibility - will be removed soon
-    
-    if not username:
+    if not get_payload(request).valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
 
-        try:
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            kanazzi = i_data.get('kanazzi', '')
-        except ValueError:
-            response_data['result'] = 'failure'
-            response_data['message'] = 'Bad input format'
-            return JsonResponse(response_data, status=400)
-
-    if not username or not check_session(kanazzi, username, action='getCoversStats', store=False):
+    if not check_request_session(request, action='getCoversStats', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -356,14 +316,14 @@ def get_covers_stats_2(request):
     logger.debug("get_covers_stats_2 called")
     response_data = {}
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        firebase_id_token = i_data.get('firebase_id_token', '')
-    except ValueError:
-        response['result'] = 'failure'
-        response['message'] = 'Bad input format'
-        return JsonResponse(response, status=400)
+    payload = get_payload(request)
+    if not payload.valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
+
+    username = payload.get('username', '')
+    firebase_id_token = payload.get('firebase_id_token', '')
 
     token_check = check_google(firebase_id_token)
 
@@ -390,18 +350,19 @@ def save_cover(request):
     logger.debug("save_cover called")
     response_data = {}
 
-    title = request.POST.get('title', '')
-    author = request.POST.get('author', '')
-    year = request.POST.get('year', '0')
-    id_cover = request.POST.get('id', '')
-    username = request.POST.get('username2', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
+    payload = get_payload(request)
+    title = payload.get('title', '')
+    author = payload.get('author', '')
+    year = payload.get('year', '0')
+    id_cover = payload.get('id', '')
+    username = payload.get('username2', '')
+    kanazzi = payload.credentials.kanazzi
     cover_file = request.FILES.get('pic', '')
-    spoti_img_url = request.POST.get('spoti_img_url', '')
-    spotify_api_url = request.POST.get('spotify_api_url', '')
-    spotify_album_url = request.POST.get('spotify_album_url', '')
-    review = request.POST.get('review', '')
-    vote = request.POST.get('vote', '')
+    spoti_img_url = payload.get('spoti_img_url', '')
+    spotify_api_url = payload.get('spotify_api_url', '')
+    spotify_album_url = payload.get('spotify_album_url', '')
+    review = payload.get('review', '')
+    vote = payload.get('vote', '')
     cover_name = ''
     upload_file_res = {}
 
@@ -469,7 +430,7 @@ def save_cover(request):
         author = urllib.parse.unquote(author)
         notif = Notification(type="new_cover", title="%s added a new album" % username, message="%s - %s" % (title, author), username=username)
         if id_cover == "0":    #do not send notification for cover editing...
-            notif.save()
+            save_notifications([notif])
     else:
         response_body = {"result": "failure", "message": json.loads(response.text)['message'], "status_code": str(status_code)}
         return JsonResponse(response_body, status=status_code, safe=False)
@@ -506,23 +467,15 @@ def get_covers_by_search(request):
     logger.debug("Entering search covers by query")
     response_data = {}
 
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
+    payload = get_payload(request)
+    if not payload.valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
 
-    #backward compatibility - will be removed soon
-    if not username:
+    search = payload.get('search', '')
 
-        try:
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            kanazzi = i_data.get('kanazzi', '')
-            search = i_data.get('search', '')
-        except ValueError:
-            response_data['result'] = 'failure'
-            response_data['message'] = 'Bad input format'
-            return JsonResponse(response_data, status=400)
-
-    if not username or not kanazzi or not check_session(kanazzi, username, action='searchCovers', store=False):
+    if not check_request_session(request, action='searchCovers', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -548,24 +501,16 @@ def get_covers_by_search_ng(request):
     logger.debug("Entering search covers by query")
     response_data = {}
 
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '').strip()
+    payload = get_payload(request)
+    if not payload.valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
 
-    #backward compatibility - will be removed soon
-    if not username:
+    search = payload.get('search', '')
+    limit = payload.get('limit', '15')
 
-        try:
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            kanazzi = i_data.get('kanazzi', '')
-            search = i_data.get('search', '')
-            limit = i_data.get('limit', '15')
-        except ValueError:
-            response_data['result'] = 'failure'
-            response_data['message'] = 'Bad input format'
-            return JsonResponse(response_data, status=400)
-
-    if not username or not kanazzi or not check_session(kanazzi, username, action='searchCovers', store=False):
+    if not check_request_session(request, action='searchCovers', store=False):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -6,3 +6,21 @@ MONGO_API_PWD = os.environ.get('COVER_API_PW', '')
 MONGO_SERVER_CERTIFICATE = os.environ.get('MONGO_SERVER_CERTIFICATE')
 MAX_FILE_SIZE = os.environ.get('UPLOAD_MAX_SIZE', 512000)
 
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 300))
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 1024))
+
+SESSION_VALIDITY_HOURS = int(os.environ.get('SESSION_VALIDITY_HOURS', 3))
+SESSION_CLOCK_SKEW_HOURS = int(os.environ.get('SESSION_CLOCK_SKEW_HOURS', 1))
+SESSION_REPLAY_SYNC_INTERVAL = float(os.environ.get('SESSION_REPLAY_SYNC_INTERVAL', 1))
+SESSION_AUDIT = os.environ.get('SESSION_AUDIT', 'False') == 'True'
+
+WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 2))
+
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 600))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 100))
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 200))
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 500))
+MAX_CLONE_SEASONS = int(os.environ.get('MAX_CLONE_SEASONS', 50))
+NOTIFICATION_COALESCE_WINDOW = int(os.environ.get('NOTIFICATION_COALESCE_WINDOW', 300))
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', '/tmp/sticazzi_archive')
+FEED_PAGE_SIZE = int(os.environ.get('FEED_PAGE_SIZE', 50))
@@ -0,0 +1,130 @@
+"""
+    iCarusi BE - Data generations and generation keyed response caches
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+
+from StiCazzi.env import PAGE_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class Generation:
+    """
+    Counter changed by every write to a set of data, kept in the "shared"
+    cache so every mod_wsgi process sees the same value.
+    Anything keyed by the generation is invalidated by a single bump.
+    """
+
+    def __init__(self, name):
+        self.key = 'generation:%s' % name
+
+    def get(self):
+        """ Current value, None if the shared store is not reachable """
+        store = caches['shared']
+        try:
+            value = store.get(self.key)
+            if value is None:
+                # Time based start, never equal to a value used before a cache wipe
+                store.add(self.key, int(time.time() * 1000))
+                value = store.get(self.key)
+            return value
+        except Exception as exception:
+            logger.error("Generation store not available: %s" % exception)
+            return None
+
+    def bump(self):
+        store = caches['shared']
+        try:
+            try:
+                store.incr(self.key)
+            except ValueError:
+                store.set(self.key, int(time.time() * 1000))
+        except Exception as exception:
+            logger.error("Generation store not available: %s" % exception)
+
+    def bump_on_commit(self):
+        """ Bump once the current transaction is committed (now in autocommit mode) """
+        transaction.on_commit(self.bump)
+
+
+class ResponseCache:
+    """
+    Response payloads stored under the current generation of the data they show,
+    in their own cache alias (never in the "shared" one)
+    """
+
+    def __init__(self, name, generation, timeout=PAGE_CACHE_TTL, alias='pages'):
+        self.name = name
+        self.generation = generation
+        self.timeout = timeout
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self.rebuild_time = 0.0
+        self._lock = threading.Lock()
+
+    def _key(self, generation, params):
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return 'response:%s:%s:%s' % (self.name, generation, digest)
+
+    def get_or_build(self, params, build):
+        """
+        Cached payload for the request params, build() is called on a miss.
+        build() may return None for payloads that must not be cached.
+        """
+        generation = self.generation.get()
+        store = caches[self.alias]
+        if generation is not None:
+            try:
+                payload = store.get(self._key(generation, params))
+            except Exception as exception:
+                logger.error("Response cache not available: %s" % exception)
+                payload = None
+            if payload is not None:
+                with self._lock:
+                    self.hits += 1
+                logger.debug("%s cache hit (generation %s)" % (self.name, generation))
+                return payload
+
+        started = time.monotonic()
+        payload = build()
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.misses += 1
+            self.rebuild_time += elapsed
+        logger.debug("%s cache miss (generation %s), rebuilt in %.1fms" % (self.name, generation, elapsed * 1000))
+
+        if payload is not None and generation is not None:
+            try:
+                store.set(self._key(generation, params), payload, self.timeout)
+            except Exception as exception:
+                logger.error("Response cache not available: %s" % exception)
+        return payload
+
+    def stats(self):
+        """ Hit ratio and average rebuild time of this process """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0,
+                'avg_rebuild_ms': round(self.rebuild_time * 1000 / self.misses, 1) if self.misses else 0,
+            }
+
+
+catalogue_generation = Generation('catalogue')
+configuration_generation = Generation('configuration')
+media_catalogue_generation = Generation('media_catalogue')
+movie_generation = Generation('movie')
+
+# getTvShows3 pages
+tvshow_pages = ResponseCache('tvshows3', catalogue_generation)
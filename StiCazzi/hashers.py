@@ -0,0 +1,64 @@
+"""
+    iCarusi BE - Token hashers
+"""
+
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.contrib.auth.hashers import BasePasswordHasher, mask_hash
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_noop as _
+
+
+class RosebudTokenHasher(BasePasswordHasher):
+    """
+    Keyed HMAC-SHA256 for the random rosebud_uid tokens.
+    The tokens are uuid4 values, so a slow password hasher adds nothing but latency.
+    Format: rosebud_hmac$<version>$<hexdigest>
+    """
+
+    algorithm = 'rosebud_hmac'
+    version = 1
+
+    def salt(self):
+        # uuid4 tokens carry their own entropy, no salt is stored
+        return ''
+
+    def _digest(self, password):
+        key = settings.ROSEBUD_TOKEN_KEY.encode('utf-8')
+        return hmac.new(key, str(password).encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def encode(self, password, salt=''):
+        return "%s$%d$%s" % (self.algorithm, self.version, self._digest(password))
+
+    def decode(self, encoded):
+        algorithm, version, digest = encoded.split('$', 2)
+        assert algorithm == self.algorithm
+        return {
+            'algorithm': algorithm,
+            'hash': digest,
+            'salt': '',
+            'version': int(version),
+        }
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        return constant_time_compare(decoded['hash'], self._digest(password))
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            _('algorithm'): decoded['algorithm'],
+            _('version'): decoded['version'],
+            _('hash'): mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded):
+        try:
+            return self.decode(encoded)['version'] != self.version
+        except (AssertionError, ValueError):
+            return True
+
+    def harden_runtime(self, password, encoded):
+        pass
@@ -0,0 +1,165 @@
+"""
+    iCarusi BE - Google / Firebase ID token verification
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from google.auth import jwt
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_OAUTH2_CERTS_URL = os.environ.get('GOOGLE_OAUTH2_CERTS_URL', 'https://www.googleapis.com/oauth2/v1/certs')
+FIREBASE_CERTS_URL = os.environ.get(
+    'FIREBASE_CERTS_URL',
+    'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+)
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+DEFAULT_KEYS_MAX_AGE = 300
+ID_TOKEN_CACHE_SIZE = int(os.environ.get('ID_TOKEN_CACHE_SIZE', 1024))
+
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+class HttpKeySource:
+    """ Signing certificates served over HTTP (Google, or a local stand-in server) """
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        """ Return (certificates by key id, seconds they can be cached) """
+        response = requests.get(self.url, timeout=self.timeout)
+        if response.status_code != 200:
+            raise ValueError('Could not fetch certificates at %s: %s' % (self.url, response.status_code))
+
+        max_age = DEFAULT_KEYS_MAX_AGE
+        match = MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+        if match:
+            max_age = int(match.group(1))
+        return json.loads(response.text), max_age
+
+
+class StaticKeySource:
+    """ Fixed certificates, for offline use """
+
+    def __init__(self, certs, max_age=DEFAULT_KEYS_MAX_AGE):
+        self.certs = certs
+        self.max_age = max_age
+
+    def fetch(self):
+        return dict(self.certs), self.max_age
+
+
+class KeyStore:
+    """ Process wide cache of the signing certificates, honouring the source max-age """
+
+    # Do not hammer the source when a token comes with an unknown key id
+    MIN_REFRESH_INTERVAL = 30
+
+    def __init__(self, source):
+        self.source = source
+        self._certs = {}
+        self._expires = 0
+        self._fetched = 0
+        self._lock = threading.Lock()
+
+    def get(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._expires or (force and now - self._fetched >= self.MIN_REFRESH_INTERVAL):
+                certs, max_age = self.source.fetch()
+                self._certs = certs
+                self._fetched = now
+                self._expires = now + max_age
+                logger.debug("Signing keys refreshed: %s key(s), max-age %ss" % (len(certs), max_age))
+            return self._certs
+
+
+class IdTokenVerifier:
+    """
+    Verifies signed ID tokens against a KeyStore.
+    Decoded claims are cached by token digest until the token expires.
+    """
+
+    def __init__(self, key_store, issuers, audience=None, cache_size=ID_TOKEN_CACHE_SIZE):
+        self.key_store = key_store
+        self.issuers = issuers
+        self.audience = audience
+        self.cache_size = cache_size
+        self._claims = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _decode(self, token):
+        try:
+            return jwt.decode(token, certs=self.key_store.get(), audience=self.audience)
+        except ValueError as exception:
+            if 'Certificate for key id' not in str(exception):
+                raise
+            # Keys have been rotated before the cache expiration
+            return jwt.decode(token, certs=self.key_store.get(force=True), audience=self.audience)
+
+    def verify(self, token):
+        """ Return the token claims, raise ValueError if the token is not valid """
+        if not token:
+            raise ValueError('Empty token')
+
+        digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.time()
+        with self._lock:
+            claims = self._claims.get(digest)
+            if claims is not None:
+                if claims['exp'] > now:
+                    self._claims.move_to_end(digest)
+                    return claims
+                del self._claims[digest]
+
+        claims = self._decode(token)
+        if claims.get('iss') not in self.issuers:
+            raise ValueError('Wrong issuer.')
+        if not claims.get('sub'):
+            raise ValueError('Missing subject.')
+
+        with self._lock:
+            self._claims[digest] = claims
+            while len(self._claims) > self.cache_size:
+                self._claims.popitem(last=False)
+        return claims
+
+
+google_id_tokens = IdTokenVerifier(KeyStore(HttpKeySource(GOOGLE_OAUTH2_CERTS_URL)), GOOGLE_ISSUERS)
+
+_firebase_id_tokens = None
+
+
+def firebase_project_id():
+    """ Firebase project id, from the environment or the Google service account file """
+    project_id = os.environ.get('FIREBASE_PROJECT_ID', '')
+    google_account_file = os.environ.get('GOOGLE_JSON', '')
+    if not project_id and google_account_file:
+        with open(google_account_file) as account_file:
+            project_id = json.load(account_file).get('project_id', '')
+    return project_id
+
+
+def get_firebase_id_tokens():
+    """ Verifier for the Firebase ID tokens of the project """
+    global _firebase_id_tokens
+    if _firebase_id_tokens is None:
+        project_id = firebase_project_id()
+        if not project_id:
+            raise ValueError('Firebase project id not found.')
+        _firebase_id_tokens = IdTokenVerifier(
+            KeyStore(HttpKeySource(FIREBASE_CERTS_URL)),
+            ('https://securetoken.google.com/%s' % project_id,),
+            audience=project_id
+        )
+    return _firebase_id_tokens
@@ -0,0 +1,114 @@
+"""
+    iCarusi BE - Compressed NDJSON archives of old rows
+"""
+
+import gzip
+import json
+import os
+from contextlib import contextmanager
+from datetime import date
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from StiCazzi.management.batching import delete_in_batches
+from StiCazzi.models import Notification, Session
+
+# Archived tables: model, date field used for cutoff and partitioning, extra filter
+ARCHIVED = {
+    'notifications': (Notification, 'created', {'sent': True}),
+    'sessions': (Session, 'datetime', {}),
+}
+# Archived by prune_sessions as they expire: none would be left for archive_rows
+PRUNE_ARCHIVED = {'sessions'}
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    """ DjangoJSONEncoder keeping the microseconds of the dates """
+
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return super().default(o)
+
+
+class ArchiveWriter:
+    """
+    Writes each batch of rows to its own part files,
+    <directory>/<name>/<YYYY-MM-DD>.<first pk>-<last pk>.ndjson.gz by the date of
+    date_field. A part is fsynced and read back before write() returns, so the
+    rows can be deleted: a killed run never leaves a damaged file behind.
+    """
+
+    def __init__(self, directory, name, date_field, pk_field):
+        self.directory = os.path.join(directory, name)
+        self.date_field = date_field
+        self.pk_field = pk_field
+        self.parts = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _write_part(self, path, rows):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as raw_file:
+            with gzip.GzipFile(fileobj=raw_file, mode='wb') as archive_file:
+                for row in rows:
+                    archive_file.write((json.dumps(row, cls=ArchiveEncoder) + '\n').encode('utf-8'))
+            raw_file.flush()
+            os.fsync(raw_file.fileno())
+
+        read_back = sum(1 for _ in read_archive(temp_path))
+        if read_back != len(rows):
+            os.remove(temp_path)
+            raise IOError("%s: %s rows written, %s read back" % (temp_path, len(rows), read_back))
+        os.replace(temp_path, path)
+
+    def write(self, rows):
+        days = {}
+        for row in rows:
+            days.setdefault(row[self.date_field].date().isoformat(), []).append(row)
+
+        for day, day_rows in days.items():
+            # Named by pk range: a batch archived again after a kill replaces its part
+            part = '%s.%s-%s.ndjson.gz' % (day, day_rows[0][self.pk_field], day_rows[-1][self.pk_field])
+            self._write_part(os.path.join(self.directory, part), day_rows)
+            self.parts += 1
+
+        # The renames must be on disk too
+        directory_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+
+def archive_in_batches(queryset, writer, batch_size=1000, pause=0.0):
+    """ delete_in_batches, each batch written to the archive before it is deleted """
+    model = queryset.model
+
+    def archive(pks):
+        # Raises if the part is not safely on disk: the batch is not deleted then
+        writer.write(list(model.objects.filter(pk__in=pks).order_by('pk').values()))
+
+    return delete_in_batches(queryset, batch_size, pause, before_delete=archive)
+
+
+def read_archive(path):
+    """ Yield the rows of an archive file """
+    with gzip.open(path, 'rt', encoding='utf-8') as archive_file:
+        for line in archive_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+@contextmanager
+def stored_dates(model):
+    """ Keep the archived values of the auto_now / auto_now_add fields while restoring """
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
@@ -0,0 +1,37 @@
+"""
+    iCarusi BE - Batched maintenance helpers
+"""
+
+import time
+
+
+def pk_batches(queryset, batch_size):
+    """ Yield lists of primary keys of the queryset, in pk order, batch_size at a time """
+    last_pk = None
+    while True:
+        batch_qs = queryset.order_by('pk')
+        if last_pk is not None:
+            batch_qs = batch_qs.filter(pk__gt=last_pk)
+        pks = list(batch_qs.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def delete_in_batches(queryset, batch_size=1000, pause=0.0, before_delete=None):
+    """
+    Delete the rows of the queryset in bounded pk batches, each one in its own
+    short statement, so no long lock is held on the table.
+    Returns (deleted rows, elapsed seconds).
+    """
+    model = queryset.model
+    deleted = 0
+    started = time.monotonic()
+    for pks in pk_batches(queryset, batch_size):
+        if before_delete:
+            before_delete(pks)
+        deleted += model.objects.filter(pk__in=pks).delete()[0]
+        if pause:
+            time.sleep(pause)
+    return deleted, time.monotonic() - started
@@ -0,0 +1,39 @@
+"""
+    iCarusi BE - Archive and delete old notifications
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from StiCazzi.env import ARCHIVE_DIR
+from StiCazzi.management.archive import ARCHIVED, PRUNE_ARCHIVED, ArchiveWriter, archive_in_batches
+
+
+class Command(BaseCommand):
+    help = ('Move rows older than the cutoff to gzip NDJSON part files partitioned by date, '
+            'then delete them in pk batches')
+
+    def add_arguments(self, parser):
+        # Sessions are archived by prune_sessions
+        parser.add_argument('table', choices=sorted(set(ARCHIVED) - PRUNE_ARCHIVED),
+                            help='Rows to archive (notifications: sent ones only)')
+        parser.add_argument('--days', type=int, default=30, help='Archive rows older than this')
+        parser.add_argument('--dir', default=ARCHIVE_DIR, help='Archive directory')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows archived and deleted per statement')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches, to leave room to live traffic')
+
+    def handle(self, *args, **options):
+        model, date_field, extra_filter = ARCHIVED[options['table']]
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old_rows = model.objects.filter(**{'%s__lt' % date_field: cutoff}, **extra_filter)
+
+        writer = ArchiveWriter(options['dir'], options['table'], date_field, model._meta.pk.attname)
+
+        deleted, elapsed = archive_in_batches(old_rows, writer, options['batch_size'], options['pause'])
+
+        rate = deleted / elapsed if elapsed else 0.0
+        self.stdout.write("Archived %s %s older than %s to %s part files in %s in %.2fs (%.1f rows/sec)"
+                          % (deleted, options['table'], cutoff, writer.parts, writer.directory, elapsed, rate))
@@ -0,0 +1,49 @@
+"""
+    iCarusi BE - Merge duplicate (user, tvshow) votes
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from StiCazzi.models import TvShowVote, Like
+from StiCazzi.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = ('Keep the latest vote of every (user, tvshow) pair with several votes, moving the likes of the '
+            'others to it. Run before the migration adding the vote_user_tvshow_uniq constraint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the duplicates')
+
+    def handle(self, *args, **options):
+        pairs = TvShowVote.objects.values('user', 'tvshow').annotate(votes=Count('id_vote'))\
+                                  .filter(votes__gt=1).order_by()
+        merged = moved = 0
+        for pair in pairs:
+            with transaction.atomic():
+                votes = list(TvShowVote.objects.select_for_update()
+                                               .filter(user=pair['user'], tvshow=pair['tvshow'])
+                                               .order_by('-updated', '-id_vote'))
+                kept, duplicates = votes[0], votes[1:]
+                merged += len(duplicates)
+                if options['dry_run']:
+                    continue
+
+                # One like per user on the kept vote, the latest one
+                likers = set(Like.objects.filter(id_vote=kept).values_list('user', flat=True))
+                for like in Like.objects.filter(id_vote__in=duplicates).order_by('-updated', '-id_like'):
+                    if like.user_id in likers:
+                        continue
+                    like.id_vote = kept
+                    like.save(update_fields=['id_vote'])
+                    likers.add(like.user_id)
+                    moved += 1
+                # delete() sends the signals maintaining the counters
+                TvShowVote.objects.filter(id_vote__in=[vote.id_vote for vote in duplicates]).delete()
+
+        if merged and not options['dry_run']:
+            rebuild_stats()
+        self.stdout.write("%s %s duplicate votes (%s likes moved to the kept votes)"
+                          % ('Found' if options['dry_run'] else 'Removed', merged, moved))
@@ -0,0 +1,53 @@
+"""
+    iCarusi BE - Notification dispatcher worker
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from StiCazzi.notifications import dispatch_batch, drop_stale, get_transport
+
+
+class Command(BaseCommand):
+    help = 'Send the unsent notifications. Several workers can run at the same time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transport', default='fcm', help='fcm, log or the dotted path of a transport class')
+        parser.add_argument('--batch-size', type=int, default=100, help='Notifications claimed per transaction')
+        parser.add_argument('--idle-sleep', type=float, default=2.0, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when the outbox is empty')
+        parser.add_argument('--max-age', type=int, default=3600,
+                            help='Seconds after which an unsent notification is dropped instead of sent')
+
+    def handle(self, *args, **options):
+        transport = get_transport(options['transport'])
+        started = time.monotonic()
+        total = deliveries = reported = 0
+        dropped = drop_stale(options['max_age'])
+        if dropped:
+            self.stdout.write("Dropped %s notifications older than %ss" % (dropped, options['max_age']))
+
+        try:
+            while True:
+                sent, delivered = dispatch_batch(transport, options['batch_size'], options['max_age'])
+                total += sent
+                deliveries += delivered
+                if sent:
+                    continue
+                if options['once']:
+                    break
+                if total != reported:
+                    self.report(total, deliveries, started)
+                    reported = total
+                drop_stale(options['max_age'])
+                time.sleep(options['idle_sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.report(total, deliveries, started)
+
+    def report(self, total, deliveries, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write("Sent %s notifications (%s deliveries) in %.2fs: %.1f notifications/sec"
+                          % (total, deliveries, elapsed, total / elapsed if elapsed else 0))
@@ -0,0 +1,47 @@
+"""
+    iCarusi BE - Prune expired sessions
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from StiCazzi.env import ARCHIVE_DIR, SESSION_VALIDITY_HOURS, SESSION_CLOCK_SKEW_HOURS
+from StiCazzi.management.archive import ARCHIVED, ArchiveWriter, archive_in_batches
+from StiCazzi.management.batching import delete_in_batches
+from StiCazzi.models import Session, SessionReplay
+
+
+class Command(BaseCommand):
+    help = ('Delete the Session and SessionReplay rows older than the session validity window, '
+            'in small pk batches. Session audit rows are archived first (see restore_archive)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=SESSION_VALIDITY_HOURS + SESSION_CLOCK_SKEW_HOURS,
+                            help='Delete sessions older than this (default: session validity window '
+                                 'plus the accepted clock skew, the lifetime of a token)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows deleted per statement')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches, to leave room to live traffic')
+        parser.add_argument('--dir', default=ARCHIVE_DIR, help='Archive directory of the Session rows')
+        parser.add_argument('--no-archive', action='store_true', help='Delete the Session rows without archiving them')
+
+    def handle(self, *args, **options):
+        # One extra hour, as the replay window buckets
+        cutoff = timezone.now() - timedelta(hours=options['hours'] + 1)
+        # Replayed tokens older than this are refused by the expiration check anyway
+        for model in (Session, SessionReplay):
+            expired = model.objects.filter(datetime__lt=cutoff)
+
+            if model is Session and not options['no_archive']:
+                date_field = ARCHIVED['sessions'][1]
+                writer = ArchiveWriter(options['dir'], 'sessions', date_field, model._meta.pk.attname)
+                deleted, elapsed = archive_in_batches(expired, writer, options['batch_size'], options['pause'])
+            else:
+                deleted, elapsed = delete_in_batches(expired, options['batch_size'], options['pause'])
+
+            rate = deleted / elapsed if elapsed else 0.0
+            self.stdout.write("Deleted %s %s rows older than %s in %.2fs (%.1f rows/sec)"
+                              % (deleted, model.__name__, cutoff, elapsed, rate))
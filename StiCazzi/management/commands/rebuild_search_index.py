@@ -0,0 +1,27 @@
+"""
+    iCarusi BE - Rebuild the TvShow search index
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from StiCazzi.management.batching import pk_batches
+from StiCazzi.models import TvShow
+from StiCazzi.search import index_tvshows
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the title/media search tokens of every TvShow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Shows indexed per transaction')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        indexed = 0
+        for pks in pk_batches(TvShow.objects.all(), options['batch_size']):
+            index_tvshows(list(TvShow.objects.filter(pk__in=pks)))
+            indexed += len(pks)
+
+        self.stdout.write("Indexed %s shows in %.2fs" % (indexed, time.monotonic() - started))
@@ -0,0 +1,18 @@
+"""
+    iCarusi BE - Rebuild the TvShow/TvShowVote counter tables
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from StiCazzi.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute tvshow_stat and votes_user counters from scratch'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rebuild_stats()
+        self.stdout.write("Stats rebuilt in %.2fs" % (time.monotonic() - started))
@@ -0,0 +1,47 @@
+"""
+    iCarusi BE - Load archived notifications / sessions back
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from StiCazzi.management.archive import ARCHIVED, read_archive, stored_dates
+
+
+class Command(BaseCommand):
+    help = 'Load archive files written by archive_rows / prune_sessions back into their table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='<dir>/<table>/<YYYY-MM-DD>.*.ndjson.gz files')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows inserted per statement')
+
+    def handle(self, *args, **options):
+        for path in options['files']:
+            table = os.path.basename(os.path.dirname(os.path.abspath(path)))
+            if table not in ARCHIVED:
+                raise CommandError("%s is not in a %s directory" % (path, ' / '.join(sorted(ARCHIVED))))
+            model = ARCHIVED[table][0]
+
+            restored = 0
+            batch = []
+            with stored_dates(model):
+                for row in read_archive(path):
+                    batch.append(model(**row))
+                    if len(batch) >= options['batch_size']:
+                        restored += self.insert(model, batch)
+                        batch = []
+                restored += self.insert(model, batch)
+
+            self.stdout.write("Restored %s %s from %s (rows already present are skipped)" % (restored, table, path))
+
+    @staticmethod
+    def insert(model, rows):
+        """ Insert the rows not in the table yet, return how many """
+        if not rows:
+            return 0
+        present = set(model.objects.filter(pk__in=[row.pk for row in rows]).values_list('pk', flat=True))
+        missing = [row for row in rows if row.pk not in present]
+        # Rows restored meanwhile by someone else are still skipped
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+        return len(missing)
@@ -0,0 +1,78 @@
+"""
+    iCarusi BE - Request payload middleware
+"""
+
+import json
+from collections import namedtuple
+
+from django.utils.functional import cached_property
+
+FORM_CONTENT_TYPES = ('multipart/form-data', 'application/x-www-form-urlencoded')
+
+Credentials = namedtuple('Credentials', ['username', 'kanazzi', 'rosebud_uid', 'app_version'])
+
+
+class RequestPayload:
+    """
+    Request input decoded once: the form data for form posts carrying a
+    username (old app versions and file uploads), the JSON object of the body
+    otherwise, whatever the content type (clients posting JSON with the
+    default form content type). The body is only decoded on first access.
+    """
+
+    def __init__(self, request):
+        self._request = request
+
+    @cached_property
+    def data(self):
+        """ Decoded input, None if the body is not a valid JSON object """
+        request = self._request
+        form = request.content_type in FORM_CONTENT_TYPES
+        # The body of a multipart request can not be read once parsed
+        if form and ('username' in request.POST or request.content_type == 'multipart/form-data'):
+            return request.POST
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return request.POST if form else None
+        return data
+
+    @property
+    def valid(self):
+        return self.data is not None
+
+    def get(self, key, default=''):
+        if self.data is None:
+            return default
+        return self.data.get(key, default)
+
+    @cached_property
+    def credentials(self):
+        """ Credentials sent by the app with every request """
+        return Credentials(
+            username=self.get('username', ''),
+            kanazzi=str(self.get('kanazzi', '') or '').strip(),
+            rosebud_uid=self.get('rosebud_uid', ''),
+            app_version=self.get('app_version', '')
+        )
+
+
+def get_payload(request):
+    """ Payload attached by RequestPayloadMiddleware, created on the fly if missing """
+    payload = getattr(request, 'payload', None)
+    if payload is None:
+        payload = request.payload = RequestPayload(request)
+    return payload
+
+
+class RequestPayloadMiddleware:
+    """ Attach a RequestPayload to every request as request.payload """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.payload = RequestPayload(request)
+        return self.get_response(request)
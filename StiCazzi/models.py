@@ -98,6 +98,9 @@ class TvShow(models.Model):
     created = models.DateTimeField(auto_now_add=True, blank=True)
     updated = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Completed (not now watching) votes, kept up to date by StiCazzi.stats
+    avg_vote = models.DecimalField(max_digits=6, decimal_places=4, default=0)
+    vote_count = models.IntegerField(default=0)
 
     class Meta:
         indexes = [
@@ -105,6 +108,18 @@ class TvShow(models.Model):
         ]
 
 
+class TvShowSearchToken(models.Model):
+    id_token = models.AutoField(primary_key=True)
+    tvshow = models.ForeignKey(TvShow, on_delete=models.CASCADE)
+    field = models.CharField(max_length=1)  # t: title, m: media
+    token = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'tvshow'], name='search_token_idx'),
+        ]
+
+
 class Minchiate(models.Model):
     id_minchiata = models.AutoField(primary_key=True)
     type = models.CharField(max_length=300)
@@ -123,6 +138,29 @@ class TvShowVote(models.Model):
     comment = models.CharField(max_length=500, default='')
     created = models.DateTimeField(auto_now_add=True, blank=True)
     updated = models.DateTimeField(auto_now=True)
+    # "*" likes, kept up to date by StiCazzi.stats
+    like_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['now_watching', 'tvshow'], name='vote_nw_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'tvshow'], name='vote_user_tvshow_uniq'),
+        ]
+
+
+class TvShowStat(models.Model):
+    id_stat = models.AutoField(primary_key=True)
+    tvshow_type = models.CharField(max_length=150, unique=True)
+    count = models.IntegerField(default=0)
+
+
+class UserVoteStat(models.Model):
+    id_stat = models.AutoField(primary_key=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    count = models.IntegerField(default=0)
+
 
 class Like(models.Model):
     id_like = models.AutoField(primary_key=True)
@@ -142,6 +180,19 @@ class Session(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['session_string'], name='session_idx'),
+            models.Index(fields=['datetime'], name='session_dt_idx'),
+        ]
+
+
+class SessionReplay(models.Model):
+    id_session_replay = models.AutoField(primary_key=True)
+    # sha256 of a session string already used, see StiCazzi.replay
+    digest = models.CharField(max_length=64, unique=True)
+    datetime = models.DateTimeField(auto_now_add=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['datetime'], name='session_replay_dt_idx'),
         ]
 
 
@@ -152,12 +203,16 @@ class Notification(models.Model):
     message = models.CharField(max_length=300, null=False)
     username = models.CharField(max_length=100, null=False)
     sent = models.BooleanField(default=False)
+    # (type, actor, target) of events merged while pending, '' if never merged
+    coalesce_key = models.CharField(max_length=300, null=False, default='')
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['sent'], name='notif_sent_idx'),
+            models.Index(fields=['coalesce_key', 'sent', 'created'], name='notif_coalesce_idx'),
+            models.Index(fields=['created', 'id_notification'], name='notif_feed_idx'),
         ]
 
 
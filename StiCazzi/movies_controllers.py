@@ -2,43 +2,276 @@
  Django2 Movies Controller
 """
 
-import json
 import decimal
 import time
 import logging
+from datetime import datetime
 
-from django.http import JsonResponse
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.db.models import Q, F, Count, Avg, CharField
+from django.db.models import Q, F, Count, CharField, Subquery
 from django.db.models.functions import Cast
 from django.forms.models import model_to_dict
 
 from StiCazzi.models import Movie, TvShow, User, TvShowVote, Notification, Catalogue, Like
-from StiCazzi.controllers import check_session, test_session
+from StiCazzi.controllers import check_request_session
+from StiCazzi.middleware import get_payload
+from StiCazzi.search import search_tvshow_ids
+from StiCazzi import stats
+from StiCazzi.generation import catalogue_generation, media_catalogue_generation, movie_generation, tvshow_pages
+from StiCazzi.conditional import generation_etag, is_not_modified, not_modified, with_etag
+from StiCazzi.negotiation import encoded_response, representation
 from StiCazzi.covers_controllers import upload_cover
-from StiCazzi.utils import safe_file_name
+from StiCazzi.utils import safe_file_name, encode_cursor, decode_cursor
+from StiCazzi.env import STREAM_CHUNK_SIZE, MAX_BATCH_SIZE, MAX_CLONE_SEASONS, MAX_PAGE_SIZE
+from StiCazzi.seasons import clone_seasons
+from StiCazzi.notifications import coalesce_key, save_notifications
 logger = logging.getLogger(__name__)
 
+
+def tvshow_listing(queryset):
+    """ Load the owner of the shows in the same query """
+    return queryset.select_related('user')
+
+
+def votes_by_tvshow(tvshow_ids):
+    """ u_v_dict of every show, by show id, with a single query """
+    out = {id_tv_show: {} for id_tv_show in tvshow_ids}
+    if not out:
+        return out
+
+    dragon = TvShowVote.objects.filter(tvshow__in=out.keys())\
+                               .order_by('id_vote')\
+                               .values('tvshow', 'id_vote', 'episode', 'season', 'comment', 'now_watching')\
+                               .annotate(us_id_vote=F('id_vote'))\
+                               .annotate(us_username=F('user__username'))\
+                               .annotate(us_name=F('user__name'))\
+                               .annotate(us_vote=Cast('vote', CharField()))\
+                               .annotate(us_date=Cast('created', CharField()))\
+                               .annotate(us_update=Cast('updated', CharField()))
+
+    for rec in dragon:
+        out[rec.pop('tvshow')][rec['us_username']] = rec
+    return out
+
+
+# Columnar format: field names are sent once, in the schema header
+TVSHOW_COLUMNS = ('id', 'title', 'media', 'username', 'name', 'poster', 'datetime_sec', 'datetime',
+                  'type', 'tvshow_type', 'director', 'year', 'link', 'avg_vote', 'serie_season', 'miniseries')
+VOTE_COLUMNS = ('tvshow', 'id_vote', 'username', 'name', 'vote', 'now_watching', 'season', 'episode',
+                'comment', 'created_sec', 'updated_sec')
+
+
+def tvshow_row(tvs):
+    """ Listing values of a show loaded through tvshow_listing, in TVSHOW_COLUMNS order """
+    # dt = tvs.created.strftime("%A, %d. %B %Y %I:%M%p")
+    movie_created = tvs.created.strftime("%d %B %Y ")
+    dtsec = time.mktime(tvs.created.timetuple())
+
+    if tvs.avg_vote:
+        avg_vote_str = "%.2f" % tvs.avg_vote
+    else:
+        avg_vote_str = "0.0"
+
+    return (tvs.id_tv_show, tvs.title, tvs.media, tvs.user.username, tvs.user.name, tvs.poster,
+            dtsec, movie_created, tvs.type, tvs.tvshow_type, tvs.director, tvs.year, tvs.link,
+            avg_vote_str, tvs.serie_season, tvs.miniseries)
+
+
+def tvshow_to_dict(tvs, u_v_dict):
+    """ Listing entry of a show loaded through tvshow_listing """
+    out = dict(zip(TVSHOW_COLUMNS, tvshow_row(tvs)))
+    out['u_v_dict'] = u_v_dict
+    return out
+
+
+def vote_rows(tvshow_ids):
+    """ Votes of the shows in VOTE_COLUMNS order, dates as epoch seconds """
+    votes = TvShowVote.objects.filter(tvshow__in=tvshow_ids)\
+                              .order_by('id_vote')\
+                              .values_list('tvshow', 'id_vote', 'user__username', 'user__name', 'vote',
+                                           'now_watching', 'season', 'episode', 'comment', 'created', 'updated')
+    return [rec[:4] + (str(rec[4]),) + rec[5:9] + (rec[9].timestamp(), rec[10].timestamp())
+            for rec in votes]
+
+
+def after_cursor(movie_list, cursor_created, cursor_id):
+    """ Shows coming after (created, id) in the -created, -id_tv_show order """
+    return movie_list.filter(
+        Q(created__lt=cursor_created) | Q(created=cursor_created, id_tv_show__lt=cursor_id)
+    )
+
+
+def tvshow_summary(query, found_ids):
+    """ stat and votes_user of a listing """
+    if query:
+        tvshow_stat = dict(\
+                      TvShow.objects\
+                          .filter(id_tv_show__in=found_ids)\
+                          .values("tvshow_type")\
+                          .annotate(count=Count('tvshow_type'))\
+                          .values_list("tvshow_type", "count")
+                      )
+        tvshow_stat = {'movie': tvshow_stat.get('movie', 0), 'serie': tvshow_stat.get('serie', 0)}
+    else:
+        tvshow_stat = stats.tvshow_stat()
+
+    return tvshow_stat, stats.votes_user()
+
+
+def tvshow_page(query, limit, current_page, lazy_load, cursor_values, with_total, columnar=False):
+    """ Payload of a getTvShows3 page """
+    movie_list = TvShow.objects.order_by('-created', '-id_tv_show')
+
+    first_page = current_page == 1 if cursor_values is None else not cursor_values
+    next_cursor = ''
+    has_more = False
+
+    if query:
+        # Ranked ids from the search index, paged by offset
+        found_ids = search_tvshow_ids(query)
+        if cursor_values is not None:
+            offset = max(cursor_values[0], 0) if cursor_values else 0
+        elif lazy_load:
+            offset = limit * (current_page - 1)
+        else:
+            offset = 0
+        page_ids = found_ids[offset: offset + limit + 1] if lazy_load or cursor_values is not None else found_ids
+        by_id = tvshow_listing(TvShow.objects.filter(id_tv_show__in=page_ids)).in_bulk()
+        bounded = [by_id[id_tv_show] for id_tv_show in page_ids if id_tv_show in by_id]
+    elif cursor_values is not None:
+        page_list = movie_list
+        if cursor_values:
+            page_list = after_cursor(movie_list, *cursor_values)
+        bounded = list(tvshow_listing(page_list)[:limit + 1])
+    elif lazy_load:
+        lower_bound = limit * (current_page - 1)
+        bounded = list(tvshow_listing(movie_list)[lower_bound: lower_bound + limit + 1])
+    else:
+        bounded = list(tvshow_listing(movie_list))
+
+    # One extra row tells if there is a next page
+    if (lazy_load or cursor_values is not None) and len(bounded) > limit:
+        has_more = True
+        bounded = bounded[:limit]
+        if query:
+            next_cursor = encode_cursor(offset + limit)
+        else:
+            next_cursor = encode_cursor(bounded[-1].created, bounded[-1].id_tv_show)
+
+    # Adding all NW
+    if not query and first_page:
+        # vote_nw_idx covers the subquery, no join nor DISTINCT on TvShow
+        nw_ids = TvShowVote.objects.filter(now_watching=True).values('tvshow')
+        shown = {tvs.id_tv_show for tvs in bounded}
+        nwtv_list = tvshow_listing(TvShow.objects.filter(id_tv_show__in=Subquery(nw_ids)))
+        bounded = bounded + [tvs for tvs in nwtv_list if tvs.id_tv_show not in shown]
+    # End Adding all NW
+
+    if columnar:
+        out_list = [tvshow_row(tvs) for tvs in bounded]
+    else:
+        u_v_dicts = votes_by_tvshow([tvs.id_tv_show for tvs in bounded])
+        out_list = [tvshow_to_dict(tvs, u_v_dicts[tvs.id_tv_show]) for tvs in bounded]
+
+    #logger.debug("List size: %s", str(len(bounded)))
+    #logger.debug("Has more: %s", str(has_more))
+    #logger.debug("Query: %s", query)
+
+    tvshow_stat, votes_user = tvshow_summary(query, found_ids if query else None)
+
+    page = {'stat': tvshow_stat,
+            'tvshows': out_list,
+            'query': query,
+            'has_more': has_more,
+            'next_cursor': next_cursor,
+            'votes_user': votes_user
+           }
+    if with_total:
+        page['total_show'] = len(found_ids) if query else stats.tvshow_total()
+    if columnar:
+        page['schema'] = {'tvshows': TVSHOW_COLUMNS, 'votes': VOTE_COLUMNS}
+        page['votes'] = vote_rows([tvs.id_tv_show for tvs in bounded])
+    return page
+
+
+def tvshow_chunks(query, found_ids, chunk_size):
+    """ The whole listing, chunk_size shows at a time """
+    if query:
+        for start in range(0, len(found_ids), chunk_size):
+            chunk_ids = found_ids[start: start + chunk_size]
+            by_id = tvshow_listing(TvShow.objects.filter(id_tv_show__in=chunk_ids)).in_bulk()
+            yield [by_id[id_tv_show] for id_tv_show in chunk_ids if id_tv_show in by_id]
+        return
+
+    # Keyset walk: every chunk is a short indexed query, whatever the backend cursor support
+    movie_list = tvshow_listing(TvShow.objects.order_by('-created', '-id_tv_show'))
+    chunk = list(movie_list[:chunk_size])
+    while chunk:
+        yield chunk
+        last = chunk[-1]
+        chunk = list(after_cursor(movie_list, last.created, last.id_tv_show)[:chunk_size])
+
+
+def stream_tvshows(query, with_total, chunk_size=STREAM_CHUNK_SIZE):
+    """ getTvShows3 response for lazy_load=False, as JSON text chunks """
+    encoder = DjangoJSONEncoder()
+    found_ids = search_tvshow_ids(query) if query else None
+    tvshow_stat, votes_user = tvshow_summary(query, found_ids)
+
+    head = {'stat': tvshow_stat,
+            'query': query,
+            'has_more': False,
+            'next_cursor': '',
+            'votes_user': votes_user
+           }
+    if with_total:
+        head['total_show'] = len(found_ids) if query else stats.tvshow_total()
+    yield '{"result": "success", "payload": %s, "tvshows": [' % encoder.encode(head)[:-1]
+
+    separator = ''
+    for chunk in tvshow_chunks(query, found_ids, chunk_size):
+        if not chunk:
+            continue
+        u_v_dicts = votes_by_tvshow([tvs.id_tv_show for tvs in chunk])
+        yield separator + ', '.join(encoder.encode(tvshow_to_dict(tvs, u_v_dicts[tvs.id_tv_show])) for tvs in chunk)
+        separator = ', '
+
+    yield ']}}'
+
+
 def get_tvshows_new_opt(request):
     """ Get Tvshow New """
     logger.debug("Get Tvshows new opt called")
     response = {'result': 'success'}
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        firebase_id_token = i_data.get('firebase_id_token', '')
-        kanazzi = i_data.get('kanazzi', '')
-        query = i_data.get('query', '')
-        limit = i_data.get('limit', 15)
-        current_page = i_data.get('current_page', 1)
-        lazy_load = i_data.get('lazy_load', True)
-    except (TypeError, ValueError):
+    payload = get_payload(request)
+    if not payload.valid:
         response['result'] = 'failure'
         response['message'] = 'Bad input format'
         return JsonResponse(response, status=400)
 
-    if not check_session(kanazzi, username, action='gettvshows3', store=True):
+    query = payload.get('query', '')
+    try:
+        limit = min(max(int(payload.get('limit', 15)), 1), MAX_PAGE_SIZE)
+        current_page = max(int(payload.get('current_page', 1)), 1)
+    except (TypeError, ValueError):
+        response['result'] = 'failure'
+        response['message'] = 'Bad limit or current_page'
+        return JsonResponse(response, status=400)
+    lazy_load = payload.get('lazy_load', True)
+    # Keyset pagination: the app sends back next_cursor ('' for the first page)
+    cursor = payload.get('cursor', None)
+    with_total = payload.get('with_total', True)
+    # With lazy_load False: send the shows while they are read
+    stream = payload.get('stream', False)
+    # 'columnar': rows of values under a schema header, see TVSHOW_COLUMNS
+    columnar = payload.get('format', '') == 'columnar'
+
+    if not check_request_session(request, action='gettvshows3', store=True):
         response['result'] = 'failure'
         response['message'] = 'Invalid Session'
         return JsonResponse(response, status=401)
@@ -46,7 +279,7 @@ def get_tvshows_new_opt(request):
     #logger.debug("Current page: %s", current_page)
 
     if query and len(query) < 4:
-        if int(current_page) == 1:
+        if current_page == 1:
             logger.debug("Query too short: %s", query)
             response['result'] = 'failure'
             response['message'] = 'Query String too short'
@@ -54,115 +287,49 @@ def get_tvshows_new_opt(request):
         else:
             query = ''
 
-    out_list = []
-    movie_list = TvShow.objects.filter(
-        Q(title__icontains=query) | Q(media__icontains=query)
-    ).order_by('-created')
-
-    lower_bound = limit * (current_page - 1)
-    upper_bound = current_page * limit
-
-    if lazy_load:
-        bounded = movie_list[lower_bound: upper_bound]
-    else:
-        bounded = movie_list
-
-    # Adding all NW
-    if not query and current_page == 1:
-        nwtv = TvShowVote.objects.filter(now_watching=True)
-        nwtv_list = [show.tvshow for show in nwtv if show.tvshow not in bounded]
-        nwtv_list = list(set(nwtv_list))
-        bounded = list(bounded) + nwtv_list
-    # End Adding all NW
-
-    for tvs in bounded:
-        # dt = tvs.created.strftime("%A, %d. %B %Y %I:%M%p")
-        movie_created = tvs.created.strftime("%d %B %Y ")
-        dtsec = time.mktime(tvs.created.timetuple())
-
-        tvshow_votes = TvShowVote.objects.filter(tvshow=tvs)
-        avg_vote = tvshow_votes.filter(now_watching=0).aggregate(avg_vote=Avg("vote"))['avg_vote']
-        if avg_vote:
-            avg_vote_str = "%.2f" % avg_vote
-        else:
-            avg_vote_str = "0.0"
-
-        dragon = tvshow_votes.values('id_vote','episode', 'season', 'comment', 'now_watching')\
-                             .annotate(us_id_vote=F('id_vote'))\
-                             .annotate(us_username=F('user__username'))\
-                             .annotate(us_name=F('user__name'))\
-                             .annotate(us_vote=Cast('vote', CharField()))\
-                             .annotate(us_date=Cast('created', CharField()))\
-                             .annotate(us_update=Cast('updated', CharField()))
-
-        u_v_dict = {}
-        for rec in list(dragon):
-            u_v_dict[rec['us_username']] = rec
-
-        tvshow_dict = {'title': tvs.title,
-                       'media': tvs.media,
-                       # 'vote': str_vote1,
-                       'username': tvs.user.username,
-                       'name': tvs.user.name,
-                       'poster': tvs.poster,
-                       'datetime_sec': dtsec,
-                       'u_v_dict': u_v_dict,
-                       'type': tvs.type,
-                       'tvshow_type': tvs.tvshow_type,
-                       'director': tvs.director,
-                       'year': tvs.year,
-                       'id': tvs.id_tv_show,
-                       'link': tvs.link,
-                       'datetime': movie_created,
-                       'avg_vote': avg_vote_str,
-                       'serie_season': tvs.serie_season,
-                       'miniseries': tvs.miniseries
-                      }
-        out_list.append(tvshow_dict)
-
-    has_more = True
-    if len(movie_list) <= upper_bound:
-        has_more = False
-    if not lazy_load:
-        has_more = False
-
-    #logger.debug("List size: %s", str(len(bounded)))
-    #logger.debug("Has more: %s", str(has_more))
-    #logger.debug("Query: %s", query)
-    #logger.debug("Lower bound: %s", str(lower_bound))
-    #logger.debug("Upper bound: %s", str(upper_bound))
-
-    tvshow_stat = dict(\
-                  TvShow.objects\
-                      .filter(
-                          Q(title__icontains=query) | Q(media__icontains=query)
-                      )\
-                      .values("tvshow_type")\
-                      .annotate(count=Count('tvshow_type'))\
-                      .values_list("tvshow_type", "count")
-                  )
-    tvshow_stat = {'movie': tvshow_stat.get('movie', 0), 'serie': tvshow_stat.get('serie', 0)}
-
-    votes_user = TvShowVote.objects.annotate(name=F('user__username'))\
-                 .values("name")\
-                 .annotate(count=Count('user'))\
-                 .order_by('-count')
-    votes_user = [{"name": rec['name'], "count": rec['count']} for rec in list(votes_user)]
-
-    response['payload'] = {'stat': tvshow_stat,
-                           'tvshows': out_list,
-                           'query': query,
-                           'has_more': has_more,
-                           'votes_user': votes_user,
-                           'total_show': movie_list.count()
-                          }
-
-    return JsonResponse(response)
+    if stream and not lazy_load and not columnar:
+        return StreamingHttpResponse(stream_tvshows(query, with_total), content_type='application/json')
+
+    # Search cursors carry an offset, listing cursors the last (created, id)
+    cursor_values = None
+    if cursor is not None:
+        cursor_values = ()
+        if cursor:
+            try:
+                cursor_values = decode_cursor(cursor, int) if query else decode_cursor(cursor, datetime, int)
+            except ValueError:
+                response['result'] = 'failure'
+                response['message'] = 'Bad cursor'
+                return JsonResponse(response, status=400)
+
+    params = {'query': query, 'limit': limit, 'current_page': current_page,
+              'lazy_load': lazy_load, 'cursor': cursor, 'with_total': with_total, 'columnar': columnar}
+
+    # Page 1 is downloaded by every app launch
+    etag = None
+    if (cursor_values is None and current_page == 1) or cursor_values == ():
+        etag = generation_etag('tvshows3', catalogue_generation.get(), sorted(params.items()),
+                               representation(request) if columnar else 'json')
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
+    response['payload'] = tvshow_pages.get_or_build(
+        params,
+        lambda: tvshow_page(query, limit, current_page, lazy_load, cursor_values, with_total, columnar)
+    )
+
+    if columnar:
+        return with_etag(encoded_response(request, response), etag)
+    return with_etag(JsonResponse(response), etag)
 
 
 def get_movies_ct(request):
     """ Get Tvshow CT """
 
+    etag = generation_etag('moviesct', movie_generation.get())
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
     movie_list = Movie.objects.all().exclude(cinema="")
     logger.debug("Movie CT (unsecure) called")
     out = []
@@ -181,7 +348,7 @@ def get_movies_ct(request):
     response['result'] = 'success'
     response['payload'] = out
 
-    return JsonResponse(response)
+    return with_etag(JsonResponse(response), etag)
 
 
 @ensure_csrf_cookie
@@ -191,19 +358,19 @@ def setlike(request):
     logger.debug("Like called")
     response_data = {}
     response_data['result'] = 'success'
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        kanazzi = i_data.get('kanazzi', '')
-        id_vote = i_data.get('id_vote', '')
-        reaction = i_data.get('reaction', '')
-        action = i_data.get('action','fetch')
-    except (TypeError, ValueError):
+
+    payload = get_payload(request)
+    if not payload.valid:
         response_data['result'] = 'failure'
         response_data['message'] = 'Bad input format'
         return JsonResponse(response_data, status=400)
 
-    if not check_session(kanazzi, username, action='setlike', store=True):
+    username = payload.credentials.username
+    id_vote = payload.get('id_vote', '')
+    reaction = payload.get('reaction', '')
+    action = payload.get('action', 'fetch')
+
+    if not check_request_session(request, action='setlike', store=True):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -213,8 +380,7 @@ def setlike(request):
     if action == "set":
 
       items = Like.objects.filter(id_vote=id_vote, user=current_user)
-      vote = TvShowVote.objects.filter(id_vote=id_vote).first()
-      tvshow = TvShow.objects.filter(id_tv_show=vote.tvshow_id).first()
+      vote = TvShowVote.objects.select_related('user').filter(id_vote=id_vote).first()
       if items:
           like = items.first()
           if reaction == "O":
@@ -228,20 +394,54 @@ def setlike(request):
           like.save()
           response_data['message'] = 'Like created for id_vote %s' % id_vote
 
-      # Special usage for notification
-      # title -> tv_show_id
-      # message -> the guy who has wrote the comment
-      # username -> the guy who has clicked on like
-      if reaction != "O" and current_user.username != vote.user.username:
-        notification = Notification(
-                type="like", \
-                title="%s" % tvshow.id_tv_show, \
-                message="%s" % vote.user.username, \
-                username=current_user.username)
-        notification.save()
-
-    response_data['payload'] = {'id_vote': id_vote, 'count': len(Like.objects.filter(id_vote=id_vote, reaction="*")), 'you': len(Like.objects.filter(id_vote=id_vote, reaction="*", user=current_user))}
- 
+      notification = like_notification(current_user, vote, reaction)
+      if notification:
+        save_notifications([notification])
+
+      catalogue_generation.bump_on_commit()
+
+    like_count = TvShowVote.objects.filter(id_vote=id_vote).values_list('like_count', flat=True).first()
+    response_data['payload'] = {'id_vote': id_vote, 'count': like_count or 0, 'you': Like.objects.filter(id_vote=id_vote, reaction="*", user=current_user).count()}
+
+    return JsonResponse(response_data)
+
+
+def get_likes(request):
+    """ Like count and reaction of the caller for a list of votes """
+
+    logger.debug("Get likes called")
+    response_data = {}
+    response_data['result'] = 'success'
+
+    payload = get_payload(request)
+    id_votes = payload.get('id_votes', [])
+    if not payload.valid or not isinstance(id_votes, list):
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
+
+    if len(id_votes) > MAX_BATCH_SIZE:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Too many votes: max %s' % MAX_BATCH_SIZE
+        return JsonResponse(response_data, status=400)
+
+    if not check_request_session(request, action='getlikes', store=True):
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Invalid Session'
+        return JsonResponse(response_data, status=401)
+
+    username = payload.credentials.username
+    like_counts = dict(TvShowVote.objects.filter(id_vote__in=id_votes).values_list('id_vote', 'like_count'))
+    reactions = dict(Like.objects.filter(id_vote__in=like_counts.keys(), user__username=username)\
+                                 .order_by('id_like')\
+                                 .values_list('id_vote', 'reaction'))
+
+    response_data['payload'] = [{'id_vote': id_vote,
+                                 'count': count,
+                                 'you': 1 if reactions.get(id_vote) == "*" else 0,
+                                 'reaction': reactions.get(id_vote, '')
+                                } for id_vote, count in like_counts.items()]
+
     return JsonResponse(response_data)
 
 
@@ -252,25 +452,16 @@ def deletemovie(request):
     response_data = {}
     response_data['result'] = 'success'
 
-    # backward compatibility
-    movie_id = request.POST.get('id', '')
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '')
-    # end backward compatibility
-
-    if not username:
-        try:
-            i_data = json.loads(request.body)
-            username = i_data.get('username', '')
-            kanazzi = i_data.get('kanazzi', '')
-            movie_id = i_data.get('id', '')
-        except (TypeError, ValueError):
-            response['result'] = 'failure'
-            response['message'] = 'Bad input format'
-            return JsonResponse(response, status=400)
+    payload = get_payload(request)
+    if not payload.valid:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
 
+    username = payload.credentials.username
+    movie_id = str(payload.get('id', ''))
 
-    if not check_session(kanazzi, username, action='deletemovie', store=True):
+    if not check_request_session(request, action='deletemovie', store=True):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -288,6 +479,7 @@ def deletemovie(request):
         if show_to_delete:
             tvshow = show_to_delete[0]
             tvshow.delete()
+            catalogue_generation.bump_on_commit()
             response_data['message'] = 'Tvshow with id=' + movie_id + " deleted succcessfully."
         else:
             response_data['result'] = 'failure'
@@ -296,87 +488,350 @@ def deletemovie(request):
     return JsonResponse(response_data)
 
 
-def create_update_vote(current_user, tvshow, vote_dict):
-    """ Create Update vote """
-    tvsv = TvShowVote.objects.filter(user=current_user, tvshow=tvshow[0])
-    if not tvsv:
-        tvsv = TvShowVote(vote=vote_dict['vote'], user=current_user, tvshow=tvshow[0], \
-                          now_watching=vote_dict["nw"], season=vote_dict["season"], \
-                          episode=vote_dict["episode"], comment=vote_dict['comment'])
-        tvsv.save()
-
-        if vote_dict.get('like',''):
-            like = Like(reaction=vote_dict['like'], user=current_user, id_vote=tvsv)
-            like.save()
-
+def vote_notifications(current_user, tvshow, vote_dict, current_vote=None):
+    """
+    Notifications of a vote write, to be computed before it is applied:
+    current_vote is the existing vote of the user (None for a new one)
+    """
+    notifications = []
+    if current_vote is None:
         if not vote_dict["nw"]:
-            notification = Notification(
+            notifications.append(Notification(
                 type="new_vote", \
-                title="%s voted for a %s..." % (current_user.username, tvshow[0].tvshow_type), \
+                title="%s voted for a %s..." % (current_user.username, tvshow.tvshow_type), \
                 message="Title: %s - Vote: %s " \
-                % (tvshow[0].title, vote_dict["vote"]), username=current_user.username)
-            notification.save()
+                % (tvshow.title, vote_dict["vote"]), username=current_user.username))
+    elif vote_dict['giveup']:
+        notifications.append(Notification(
+            type="give_up", \
+            title="%s gave up to follow a %s" % (current_user.username, tvshow.tvshow_type), \
+            message="%s" % tvshow.title, username=current_user.username))
     else:
-        current_vote = tvsv[0]
-        if vote_dict['giveup']:
-            current_vote.delete()
-
-            notification = Notification(
-                type="give_up", \
-                title="%s gave up to follow a %s" % (current_user.username, tvshow[0].tvshow_type), \
-                message="%s" % tvshow[0].title, username=current_user.username)
-            notification.save()
-
-        else:
+        # Finished watching
+        if current_vote.now_watching and not vote_dict["nw"]:
+            notifications.append(Notification(
+                type="new_vote", \
+                title="%s voted for a %s..." % (current_user.username, tvshow.tvshow_type), \
+                message="Title: %s - Vote: %s " \
+                % (tvshow.title, vote_dict["vote"]), username=current_user.username))
 
-            finished = False
-            first_comment = False
+        if current_vote.comment == "" and vote_dict["comment"] != "":
+            notifications.append(Notification(
+                type="new_comment", \
+                title="%s commented %s..." % (current_user.username, tvshow.tvshow_type), \
+                message="Title: %s - %s... " \
+                % (tvshow.title, vote_dict["comment"][:30]), username=current_user.username))
 
-            if current_vote.now_watching and not vote_dict["nw"]:
-                finished = True
+    # logger.debug(vote_dict)
+    if vote_dict["nw"] and str(vote_dict["episode"]) == "1":
+        notifications.append(Notification(
+            type="new_nw", \
+            title="%s started to watch a %s..." % (current_user.username, tvshow.tvshow_type), \
+            message="Title: %s - S%s E%s " \
+            % (tvshow.title, tvshow.serie_season, vote_dict["episode"]), username=current_user.username,
+            coalesce_key=coalesce_key("new_nw", current_user.username, tvshow.id_tv_show)))
+    return notifications
+
+
+def like_notification(current_user, vote, reaction):
+    """ Notification of a like, None if there is nothing to notify """
+    # Special usage for notification
+    # title -> tv_show_id
+    # message -> the guy who has wrote the comment
+    # username -> the guy who has clicked on like
+    if reaction == "O" or current_user.username == vote.user.username:
+        return None
+    return Notification(
+        type="like", \
+        title="%s" % vote.tvshow_id, \
+        message="%s" % vote.user.username, \
+        username=current_user.username,
+        coalesce_key=coalesce_key("like", current_user.username, vote.id_vote))
+
+
+# MySQL error: the transaction has been rolled back as deadlock victim
+DEADLOCK_ERROR = 1213
+
+
+def retry_on_deadlock(function, attempts=3, retry_integrity=False):
+    """
+    Run function, a whole transaction, again when it is picked as deadlock
+    victim (or, with retry_integrity, when it hits a unique constraint)
+    """
+    for attempt in range(attempts):
+        try:
+            return function()
+        except (OperationalError, IntegrityError) as exception:
+            if isinstance(exception, OperationalError):
+                retry = exception.args[:1] == (DEADLOCK_ERROR,)
+            else:
+                retry = retry_integrity
+            # Inside an outer transaction the rollback is not ours to retry
+            if not retry or attempt == attempts - 1 or connection.in_atomic_block:
+                raise
+            logger.debug("%s, retrying (%s)" % (exception, attempt + 1))
+
+
+def lock_or_create_vote(current_user, tvshow, defaults):
+    """
+    Vote of the user on the show locked for update, or created: (vote, created).
+    A missing row is never read with a lock: the gap lock InnoDB takes makes
+    two concurrent first votes deadlock. The unique constraint decides instead.
+    """
+    exists = TvShowVote.objects.filter(user=current_user, tvshow=tvshow).values_list('id_vote', flat=True).first()
+    if exists is None:
+        try:
+            with transaction.atomic():
+                return TvShowVote.objects.create(user=current_user, tvshow=tvshow, **defaults), True
+        except IntegrityError:
+            logger.debug("Vote created by a concurrent request")
+    return TvShowVote.objects.select_for_update().get(user=current_user, tvshow=tvshow), False
 
-            if current_vote.comment == "" and vote_dict["comment"] != "":
-                first_comment = True
 
+def create_update_vote(current_user, tvshow, vote_dict):
+    """ Create Update vote """
+    retry_on_deadlock(lambda: upsert_vote(current_user, tvshow[0], vote_dict))
+    catalogue_generation.bump_on_commit()
+
+
+@transaction.atomic
+def upsert_vote(current_user, tvshow, vote_dict):
+    """ Insert or update the vote of the user on the (user, tvshow) unique constraint """
+    current_vote, created = lock_or_create_vote(
+        current_user, tvshow,
+        {'vote': vote_dict['vote'], 'now_watching': vote_dict["nw"], 'season': vote_dict["season"],
+         'episode': vote_dict["episode"], 'comment': vote_dict['comment']}
+    )
+    notifications = vote_notifications(current_user, tvshow, vote_dict, None if created else current_vote)
+
+    if not created and vote_dict['giveup']:
+        current_vote.delete()
+    else:
+        if not created:
             current_vote.vote = vote_dict['vote']
             current_vote.now_watching = vote_dict["nw"]
             current_vote.episode = vote_dict["episode"]
             current_vote.season = vote_dict["season"]
             current_vote.comment = vote_dict["comment"]
-            current_vote.save()
+            current_vote.save(update_fields=['vote', 'now_watching', 'episode', 'season', 'comment', 'updated'])
 
-            if vote_dict.get('like',''):
-                like = Like(reaction=vote_dict['like'], user=current_user, id_vote=current_vote)
-                like.save()
+        if vote_dict.get('like',''):
+            apply_like_reactions(current_user, {current_vote.id_vote: vote_dict['like']})
 
-            if vote_dict.get('like',''):
-                like = Like(reaction=vote_dict['like'], user=current_user)
-                like.save()
+    save_notifications(notifications)
 
-            if finished:
-                notification = Notification(
-                    type="new_vote", \
-                    title="%s voted for a %s..." % (current_user.username, tvshow[0].tvshow_type), \
-                    message="Title: %s - Vote: %s " \
-                    % (tvshow[0].title, vote_dict["vote"]), username=current_user.username)
-                notification.save()
 
-            if first_comment:
-                notification = Notification(
-                    type="new_comment", \
-                    title="%s commented %s..." % (current_user.username, tvshow[0].tvshow_type), \
-                    message="Title: %s - %s... " \
-                    % (tvshow[0].title, vote_dict["comment"][:30]), username=current_user.username)
-                notification.save()
+BATCH_OPERATIONS = ('vote', 'nw', 'like')
 
-    # logger.debug(vote_dict)
-    if vote_dict["nw"] and str(vote_dict["episode"]) == "1":
-        notification = Notification(
-            type="new_nw", \
-            title="%s started to watch a %s..." % (current_user.username, tvshow[0].tvshow_type), \
-            message="Title: %s - S%s E%s " \
-            % (tvshow[0].title, tvshow[0].serie_season, vote_dict["episode"]), username=current_user.username)
-        notification.save()
+
+def vote_value(value):
+    """ Vote as stored by TvShowVote.vote (4 digits, 2 decimals) """
+    vote = decimal.Decimal(str(value))
+    if not vote.is_finite() or not 0 <= vote < 100:
+        raise ValueError('Vote out of range: %s' % value)
+    return vote.quantize(decimal.Decimal('0.01'))
+
+
+def small_int(value):
+    """ Season / episode number, as stored by a PositiveSmallIntegerField """
+    if isinstance(value, bool) or not 0 <= int(value) <= 32767:
+        raise ValueError('Not a valid number: %s' % value)
+    return int(value)
+
+
+def text(max_length):
+    def check(value):
+        if not isinstance(value, str) or len(value) > max_length:
+            raise ValueError('Not a string of at most %s chars' % max_length)
+        return value
+    return check
+
+
+# Optional operation fields, converted to what the models store
+OPERATION_FIELDS = {
+    'vote': vote_value,
+    'season': small_int,
+    'episode': small_int,
+    'comment': text(500),
+    'like': text(50),
+    'reaction': text(50),
+}
+
+
+def parse_operations(operations):
+    """ Batch operations with int tvshow / id_vote and converted fields, None if not valid """
+    if not isinstance(operations, list):
+        return None
+    out = []
+    for op in operations:
+        if not isinstance(op, dict) or op.get('op') not in BATCH_OPERATIONS:
+            return None
+        key = 'id_vote' if op['op'] == 'like' else 'tvshow'
+        try:
+            parsed = dict(op, **{key: int(op.get(key))})
+            for field, convert in OPERATION_FIELDS.items():
+                if field in op:
+                    parsed[field] = convert(op[field])
+        except (TypeError, ValueError, ArithmeticError):
+            return None
+        out.append(parsed)
+    return out
+
+
+def apply_like_reactions(current_user, reactions):
+    """ Set the like reactions of the user, by vote id ("O" removes the like) """
+    existing = {}
+    for like in Like.objects.filter(user=current_user, id_vote__in=reactions.keys()).order_by('id_like'):
+        existing.setdefault(like.id_vote_id, like)
+
+    now = timezone.now()
+    removed, updated, created = [], [], []
+    for id_vote, reaction in reactions.items():
+        like = existing.get(id_vote)
+        if reaction == "O":
+            if like:
+                removed.append(like.id_like)
+        elif like:
+            like.reaction = reaction
+            like.updated = now
+            updated.append(like)
+        else:
+            created.append(Like(id_vote_id=id_vote, user=current_user, reaction=reaction))
+
+    # delete() sends the signals maintaining like_count, bulk writes do not
+    Like.objects.filter(id_like__in=removed).delete()
+    Like.objects.bulk_update(updated, ['reaction', 'updated'])
+    Like.objects.bulk_create(created)
+    stats.refresh_like_counts(reactions.keys())
+
+
+@ensure_csrf_cookie
+def batch_votes(request):
+    """ Apply an ordered list of vote / now watching / like operations in one transaction """
+
+    logger.debug("Batch votes called")
+    response_data = {}
+    response_data['result'] = 'success'
+
+    payload = get_payload(request)
+    operations = parse_operations(payload.get('operations', []))
+    if not payload.valid or operations is None:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Bad input format'
+        return JsonResponse(response_data, status=400)
+
+    if len(operations) > MAX_BATCH_SIZE:
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Too many operations: max %s' % MAX_BATCH_SIZE
+        return JsonResponse(response_data, status=400)
+
+    if not check_request_session(request, action='batchvotes', store=True):
+        response_data['result'] = 'failure'
+        response_data['message'] = 'Invalid Session'
+        return JsonResponse(response_data, status=401)
+
+    current_user = User.objects.filter(username=payload.credentials.username).first()
+    tvshows = TvShow.objects.in_bulk({op['tvshow'] for op in operations if op['op'] != 'like'})
+    liked_votes = TvShowVote.objects.select_related('user')\
+                                    .in_bulk({op['id_vote'] for op in operations if op['op'] == 'like'})
+    for index, op in enumerate(operations):
+        if op['op'] == 'like' and op['id_vote'] not in liked_votes or op['op'] != 'like' and op['tvshow'] not in tvshows:
+            response_data['result'] = 'failure'
+            response_data['message'] = 'Operation %s: unknown tvshow or vote' % index
+            return JsonResponse(response_data, status=400)
+
+    @transaction.atomic
+    def apply_operations():
+        # Existing votes locked by primary key: no gap lock on the missing ones
+        vote_pks = TvShowVote.objects.filter(user=current_user, tvshow__in=tvshows.keys())\
+                                     .values_list('id_vote', flat=True)
+        votes = TvShowVote.objects.select_for_update().filter(id_vote__in=list(vote_pks))
+        votes = {vote.tvshow_id: vote for vote in votes}
+        created, changed, given_up = {}, {}, []
+        reactions, vote_reactions = {}, {}
+        notifications = []
+        now = timezone.now()
+
+        # Operations are applied in memory, in order, then written in bulk
+        for op in operations:
+            if op['op'] == 'like':
+                vote = liked_votes[op['id_vote']]
+                reactions[vote.id_vote] = op.get('reaction', '')
+                notification = like_notification(current_user, vote, reactions[vote.id_vote])
+                if notification:
+                    notifications.append(notification)
+                continue
+
+            tvshow = tvshows[op['tvshow']]
+            current_vote = created.get(tvshow.id_tv_show) or votes.get(tvshow.id_tv_show)
+            vote_dict = {'vote': op.get('vote', current_vote.vote if current_vote else 5),
+                         'nw': op['op'] == 'nw' or bool(op.get('nw', False)),
+                         'season': op.get('season', current_vote.season if current_vote else 1),
+                         'episode': op.get('episode', current_vote.episode if current_vote else 1),
+                         'comment': op.get('comment', current_vote.comment if current_vote else ''),
+                         'giveup': bool(op.get('giveup', False))
+                        }
+            if vote_dict['giveup'] and not current_vote:
+                continue
+            notifications += vote_notifications(current_user, tvshow, vote_dict, current_vote)
+
+            if vote_dict['giveup']:
+                created.pop(tvshow.id_tv_show, None)
+                vote_reactions.pop(tvshow.id_tv_show, None)
+                if current_vote.id_vote:
+                    given_up.append(votes.pop(tvshow.id_tv_show).id_vote)
+                    changed.pop(current_vote.id_vote, None)
+                continue
+
+            if not current_vote:
+                current_vote = created[tvshow.id_tv_show] = TvShowVote(user=current_user, tvshow=tvshow)
+            current_vote.vote = vote_dict['vote']
+            current_vote.now_watching = vote_dict['nw']
+            current_vote.season = vote_dict['season']
+            current_vote.episode = vote_dict['episode']
+            current_vote.comment = vote_dict['comment']
+            if current_vote.id_vote:
+                current_vote.updated = now
+                changed[current_vote.id_vote] = current_vote
+            if op.get('like', ''):
+                vote_reactions[tvshow.id_tv_show] = op['like']
+
+        # delete() sends the signals maintaining the counters, bulk writes do not
+        TvShowVote.objects.filter(id_vote__in=given_up).delete()
+        TvShowVote.objects.bulk_update(changed.values(), ['vote', 'now_watching', 'season', 'episode', 'comment', 'updated'])
+        TvShowVote.objects.bulk_create(created.values())
+        # Primary keys of the new votes, not returned by bulk_create on MySQL
+        vote_ids = {tvshow_id: vote.id_vote for tvshow_id, vote in votes.items()}
+        vote_ids.update(TvShowVote.objects.filter(user=current_user, tvshow__in=created.keys())\
+                                          .values_list('tvshow', 'id_vote'))
+
+        reactions.update({vote_ids[tvshow_id]: reaction for tvshow_id, reaction in vote_reactions.items()})
+        for id_vote in given_up:
+            reactions.pop(id_vote, None)
+        if reactions:
+            apply_like_reactions(current_user, reactions)
+
+        if created:
+            stats.bump_user_votes(current_user.id_user, len(created))
+        stats.refresh_tvshow_votes(set(created) | {vote.tvshow_id for vote in changed.values()})
+        save_notifications(notifications)
+        catalogue_generation.bump_on_commit()
+        return vote_ids, notifications
+
+    # A concurrent first vote on the same show makes bulk_create fail: start again
+    vote_ids, notifications = retry_on_deadlock(apply_operations, retry_integrity=True)
+
+    response_data['payload'] = {'operations': len(operations),
+                                'votes': [{'tvshow': tvshow_id, 'id_vote': id_vote} for tvshow_id, id_vote in vote_ids.items()],
+                                'notifications': len(notifications)
+                               }
+
+    return JsonResponse(response_data)
+
+
+# Fields of a show edited by its owner, avg_vote / vote_count are written by StiCazzi.stats only
+TVSHOW_EDITABLE_FIELDS = ['title', 'media', 'link', 'vote', 'type', 'serie_season', 'tvshow_type', 'miniseries',
+                          'director', 'year', 'poster', 'updated']
 
 
 @ensure_csrf_cookie
@@ -386,27 +841,29 @@ def savemovienew(request):
     response_data = {}
     response_data['result'] = 'success'
 
-    id_movie = request.POST.get('id', '')
-    title = request.POST.get('title', '')
-    media = request.POST.get('media', '')
-    link = request.POST.get('link', '')
-    vote = request.POST.get('vote', '')
-    type = request.POST.get('type', 'brand_new')
-    tvshow_type = request.POST.get('tvshow_type', 'movie')
-    serie_season = request.POST.get('serie_season', 1)
-    miniseries_sw = request.POST.get('miniseries', False)
-    clone_season = request.POST.get('clone_season', 1)
-    director = request.POST.get('director', '')
-    year = request.POST.get('year', '')
-    username = request.POST.get('username', '')
-    kanazzi = request.POST.get('kanazzi', '')
-    now_watch_sw = request.POST.get('nw', False)
-    giveup_sw = request.POST.get('giveup', False)
-    later_sw = request.POST.get('later', False)
-    season = request.POST.get('season', 1)
-    episode = request.POST.get('episode', 1)
-    comment = request.POST.get('comment', '')
-    like = request.POST.get('like', '')
+    payload = get_payload(request)
+    id_movie = payload.get('id', '')
+    title = payload.get('title', '')
+    media = payload.get('media', '')
+    link = payload.get('link', '')
+    vote = payload.get('vote', '')
+    type = payload.get('type', 'brand_new')
+    tvshow_type = payload.get('tvshow_type', 'movie')
+    serie_season = payload.get('serie_season', 1)
+    miniseries_sw = payload.get('miniseries', False)
+    clone_season = payload.get('clone_season', 1)
+    clone_poster_sw = payload.get('clone_poster', False)
+    clone_vote_sw = payload.get('clone_vote', False)
+    director = payload.get('director', '')
+    year = payload.get('year', '')
+    username = payload.credentials.username
+    now_watch_sw = payload.get('nw', False)
+    giveup_sw = payload.get('giveup', False)
+    later_sw = payload.get('later', False)
+    season = payload.get('season', 1)
+    episode = payload.get('episode', 1)
+    comment = payload.get('comment', '')
+    like = payload.get('like', '')
     uploaded_file = request.FILES.get('pic', '')
     poster_name = ''
     upload_file_res = {}
@@ -437,7 +894,15 @@ def savemovienew(request):
     if miniseries_sw == "on":
         miniseries = True
 
-    if not check_session(kanazzi, username, action='savemovienew', store=True):
+    clone_poster = False
+    if clone_poster_sw == "on":
+        clone_poster = True
+
+    clone_vote = False
+    if clone_vote_sw == "on":
+        clone_vote = True
+
+    if not check_request_session(request, action='savemovienew', store=True):
         response_data['result'] = 'failure'
         response_data['message'] = 'Invalid Session'
         return JsonResponse(response_data, status=401)
@@ -474,7 +939,8 @@ def savemovienew(request):
         tvshow.tvshow_type = tvshow_type
         tvshow.serie_season = serie_season
         tvshow.miniseries = miniseries
-        tvshow.save()
+        # The vote signal has just refreshed avg_vote / vote_count in the DB: never write them back
+        tvshow.save(update_fields=['media', 'tvshow_type', 'serie_season', 'miniseries', 'updated'])
 
         if uploaded_file:
             upload_file_res = upload_cover(request, poster_name)
@@ -489,13 +955,13 @@ def savemovienew(request):
             tvshow.link = link
 
         if upload_res != 'failure' or (tvshow.link == "" and link):
-            tvshow.save()
+            tvshow.save(update_fields=['poster', 'link', 'updated'])
 
             notification = Notification(
                 type="new_movie", \
                 title="%s uploaded a new poster/link" \
                 % username, message="Title: %s" % title, username=username)
-            notification.save()
+            save_notifications([notification])
 
         # End New feature
 
@@ -517,19 +983,7 @@ def savemovienew(request):
                             poster=poster_name, serie_season=serie_season, miniseries=miniseries)
             tvshow.save()
 
-            if tvshow_type == 'serie' and int(clone_season) > 1 and int(clone_season) < 10:
-                logger.debug("Cloning serie %s started..." % tvshow.title)
-                start = int(tvshow.serie_season) + 1
-                stop = start + int(clone_season)
-                for i in range(start, stop):
-                    tvshow_clone = TvShow(title=title, media=media, link=link, vote=vote, user=current_user,
-                            type=type, tvshow_type=tvshow_type,
-                            director=director, year=year, miniseries=miniseries,
-                            poster='', serie_season=i)
-                    logger.debug("Saving season %s" % str(tvshow_clone.serie_season))
-                    tvshow_clone.save()
-                logger.debug("Cloning serie %s finished." % tvshow_clone.title)
-
+            tvsv = None
             if not later:
 
                 if not episode:
@@ -549,6 +1003,10 @@ def savemovienew(request):
                 )
                 tvsv.save()
 
+            if tvshow_type == 'serie' and 1 < int(clone_season) <= MAX_CLONE_SEASONS:
+                clone_seasons(tvshow, int(clone_season), copy_poster=clone_poster, copy_link=True,
+                              owner_vote=tvsv if clone_vote else None)
+
             # Workaround to be removed
             show_type_string = tvshow_type
             if show_type_string == "serie":
@@ -559,7 +1017,7 @@ def savemovienew(request):
                 type="new_movie", \
                 title="%s added a new %s" % (username, show_type_string), \
                 message="Title: %s" % title, username=username)
-            notification.save()
+            save_notifications([notification])
 
             response_data['message'] = 'TvShow/Movie %s saved!' % title
 
@@ -576,7 +1034,7 @@ def savemovienew(request):
                     type="new_movie", \
                     title="%s added a new poster" % username, \
                     message="Title: %s" % title, username=username)
-                notification.save()
+                save_notifications([notification])
 
             logger.debug("Updating tvshow... Title: %s", title)
             tvshow = current_tvshow[0]
@@ -592,7 +1050,7 @@ def savemovienew(request):
             tvshow.year = year
             if poster_name:
                 tvshow.poster = poster_name
-            tvshow.save()
+            tvshow.save(update_fields=TVSHOW_EDITABLE_FIELDS)
 
             data_vote = {'nw': now_watch,
                          'episode': episode,
@@ -604,6 +1062,7 @@ def savemovienew(request):
             if not later:
                 create_update_vote(current_user, current_tvshow, data_vote)
 
+    catalogue_generation.bump_on_commit()
     response_data.update({"upload_result": upload_file_res})
 
     return JsonResponse(response_data)
@@ -611,6 +1070,10 @@ def savemovienew(request):
 
 def get_movies_datatable(request):
     """ Get Tvshow for js datatable """
+    etag = generation_etag('moviesdt', movie_generation.get())
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
     movies_list = Movie.objects.all().exclude(cinema="")
     out = []
     for rec in movies_list:
@@ -628,29 +1091,30 @@ def get_movies_datatable(request):
     response_data['result'] = 'success'
     response_data['data'] = out
 
-    return JsonResponse(response_data)
+    return with_etag(JsonResponse(response_data), etag)
 
 
 def get_catalogue(request):
     """ Get Media Catalogue """
     response = {'result':'success'}
 
-    try:
-        i_data = json.loads(request.body)
-        username = i_data.get('username', '')
-        firebase_id_token = i_data.get('firebase_id_token', '')
-        cat_type = i_data.get('cat_type', '')
-        kanazzi = i_data.get('kanazzi', '')
-    except (TypeError, ValueError):
+    payload = get_payload(request)
+    if not payload.valid:
         response['result'] = 'failure'
         response['message'] = 'Bad input format'
         return JsonResponse(response, status=400)
 
-    if not check_session(kanazzi, username, action='get_catalogue', store=True):
+    cat_type = payload.get('cat_type', '')
+
+    if not check_request_session(request, action='get_catalogue', store=True):
         response['result'] = 'failure'
         response['message'] = 'Invalid Session'
         return JsonResponse(response, status=401)
 
+    etag = generation_etag('catalogue', media_catalogue_generation.get(), cat_type)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
     if not cat_type:
         media_cat = Catalogue.objects.all()
     else:
@@ -658,4 +1122,4 @@ def get_catalogue(request):
 
     response['payload'] = [model_to_dict(rec) for rec in media_cat]
 
-    return JsonResponse(response)
+    return with_etag(JsonResponse(response), etag)
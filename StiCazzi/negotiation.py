@@ -0,0 +1,47 @@
+"""
+    iCarusi BE - Response encoding negotiation (MessagePack / gzip JSON)
+"""
+
+import json
+import re
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+GZIP_RE = re.compile(r'\bgzip\b')
+# Below this size gzip does not pay off
+GZIP_MIN_LENGTH = 200
+
+
+def representation(request):
+    """ Encoding the response will have: 'msgpack', 'gzip' or 'json' """
+    accept = request.META.get('HTTP_ACCEPT', '')
+    if msgpack is not None and any(content_type in accept for content_type in MSGPACK_CONTENT_TYPES):
+        return 'msgpack'
+    if GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        return 'gzip'
+    return 'json'
+
+
+def encoded_response(request, data, status=200):
+    """ data as MessagePack or (gzip) JSON, as asked by the Accept / Accept-Encoding headers """
+    encoding = representation(request)
+    if encoding == 'msgpack':
+        response = HttpResponse(msgpack.packb(data, default=str), content_type='application/msgpack', status=status)
+    else:
+        body = json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+        response = HttpResponse(content_type='application/json', status=status)
+        if encoding == 'gzip' and len(body) >= GZIP_MIN_LENGTH:
+            body = compress_string(body)
+            response['Content-Encoding'] = 'gzip'
+        response.content = body
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
@@ -0,0 +1,155 @@
+"""
+    iCarusi BE - Notification outbox dispatch
+"""
+
+import logging
+import os
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from StiCazzi.models import Notification, User
+from StiCazzi.env import NOTIFICATION_COALESCE_WINDOW
+
+logger = logging.getLogger(__name__)
+
+# FCM accepts up to 500 tokens per multicast message
+MULTICAST_SIZE = 500
+
+
+def coalesce_key(notification_type, actor, target=''):
+    return '%s:%s:%s' % (notification_type, actor, target)
+
+
+def save_notifications(notifications):
+    """
+    Store the notifications. One with a coalesce_key replaces the pending (not
+    yet sent) notification with the same key created in the last
+    NOTIFICATION_COALESCE_WINDOW seconds, if any, instead of adding a row.
+    """
+    now = timezone.now()
+    new = []
+    pending = {}
+    for notification in notifications:
+        if notification.coalesce_key and NOTIFICATION_COALESCE_WINDOW:
+            if notification.coalesce_key in pending:
+                pending[notification.coalesce_key].title = notification.title
+                pending[notification.coalesce_key].message = notification.message
+                continue
+            merged = Notification.objects.filter(coalesce_key=notification.coalesce_key, sent=False,
+                                                 created__gte=now - timedelta(seconds=NOTIFICATION_COALESCE_WINDOW))\
+                                         .update(title=notification.title, message=notification.message, updated=now)
+            if merged:
+                continue
+            pending[notification.coalesce_key] = notification
+        new.append(notification)
+    Notification.objects.bulk_create(new)
+
+
+class LogTransport:
+    """ Logs the messages instead of sending them (local runs, tests) """
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, tokens, title, body, data):
+        """ Send one message to the tokens, return the number of successful deliveries """
+        logger.debug("Notification to %s device(s): %s - %s" % (len(tokens), title, body))
+        self.sent.append((tuple(tokens), title, body, data))
+        return len(tokens)
+
+
+class FcmTransport:
+    """ Firebase Cloud Messaging multicast """
+
+    def __init__(self):
+        import firebase_admin
+        from firebase_admin import credentials, messaging
+
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(os.environ.get('GOOGLE_JSON', '')))
+        self.messaging = messaging
+        # send_multicast is deprecated by newer firebase-admin releases
+        self._send = getattr(messaging, 'send_each_for_multicast', None) or messaging.send_multicast
+
+    def send(self, tokens, title, body, data):
+        message = self.messaging.MulticastMessage(
+            tokens=list(tokens),
+            notification=self.messaging.Notification(title=title, body=body),
+            data=data
+        )
+        result = self._send(message)
+        if result.failure_count:
+            logger.debug("FCM: %s of %s deliveries failed" % (result.failure_count, len(tokens)))
+        return result.success_count
+
+
+TRANSPORTS = {
+    'fcm': FcmTransport,
+    'log': LogTransport,
+}
+
+
+def get_transport(name):
+    """ Transport by name, or by dotted path of a class with a send(tokens, title, body, data) method """
+    if '.' in name:
+        return import_string(name)()
+    return TRANSPORTS[name]()
+
+
+def recipients(notification, fcm_tokens):
+    """ Device tokens to notify: the vote author for likes, everybody but the author otherwise """
+    if notification.type == 'like':
+        # Special usage for like notifications, message -> the guy who has wrote the comment
+        token = fcm_tokens.get(notification.message)
+        return [token] if token else []
+    return [token for username, token in fcm_tokens.items() if username != notification.username]
+
+
+def drop_stale(max_age):
+    """
+    Mark as sent, without sending them, the unsent notifications older than
+    max_age seconds (e.g. the ones stored before the dispatcher existed).
+    Return the number of notifications dropped.
+    """
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    dropped = Notification.objects.filter(sent=False, created__lt=cutoff).update(sent=True)
+    if dropped:
+        logger.debug("Dropped %s notification(s) older than %s" % (dropped, cutoff))
+    return dropped
+
+
+def dispatch_batch(transport, batch_size=100, max_age=None):
+    """
+    Claim up to batch_size unsent notifications and send them.
+    Rows are claimed (marked sent) in a short transaction, skipping the ones
+    locked by other workers, and sent once it is committed: no lock is held
+    during the network calls and a failure never sends a notification twice.
+    Notifications older than max_age seconds are not claimed.
+    Return (notifications, deliveries).
+    """
+    with transaction.atomic():
+        claimable = Notification.objects.select_for_update(skip_locked=True).filter(sent=False)
+        if max_age is not None:
+            claimable = claimable.filter(created__gte=timezone.now() - timedelta(seconds=max_age))
+        batch = list(claimable.order_by('id_notification')[:batch_size])
+        if not batch:
+            return 0, 0
+
+        Notification.objects.filter(id_notification__in=[notification.id_notification for notification in batch])\
+                            .update(sent=True)
+
+    fcm_tokens = dict(User.objects.exclude(fcm_token='').values_list('username', 'fcm_token'))
+    deliveries = 0
+    for notification in batch:
+        tokens = recipients(notification, fcm_tokens)
+        data = {'type': notification.type, 'username': notification.username}
+        for start in range(0, len(tokens), MULTICAST_SIZE):
+            try:
+                deliveries += transport.send(tokens[start: start + MULTICAST_SIZE],
+                                             notification.title, notification.message, data)
+            except Exception as exception:
+                logger.error("Notification %s not delivered: %s" % (notification.id_notification, exception))
+    return len(batch), deliveries
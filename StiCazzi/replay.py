@@ -0,0 +1,117 @@
+"""
+    iCarusi BE - Session replay window
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from StiCazzi.env import SESSION_VALIDITY_HOURS, SESSION_CLOCK_SKEW_HOURS, SESSION_REPLAY_SYNC_INTERVAL
+from StiCazzi.models import SessionReplay
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayWindow:
+    """
+    Remembers the session strings already used during the validity window.
+
+    Checks are answered from memory: digests are kept in per-hour buckets,
+    filled by this process and by an incremental read of the SessionReplay
+    table (rows added since the last read, at most every sync_interval
+    seconds), so the other mod_wsgi processes' tokens are known too.
+    The table, with its unique digest, stays the authority when a token is
+    used: add() is one INSERT, which fails for a token already used by any
+    process, also after a restart. It is the only round-trip left on the
+    session check, and the one that makes replays impossible across
+    processes. If the table can not be read, seen() falls back on a query.
+    """
+
+    # Rows committed late (e.g. by a long request) are still read
+    SYNC_OVERLAP = 10
+
+    def __init__(self, hours=SESSION_VALIDITY_HOURS + SESSION_CLOCK_SKEW_HOURS,
+                 sync_interval=SESSION_REPLAY_SYNC_INTERVAL):
+        # A token is valid up to <hours> (validity + clock skew for tokens
+        # dated in the future) after it is first seen. A token seen at the
+        # end of an hour can still be replayed <hours> later, so one extra
+        # bucket is kept
+        self.buckets_kept = hours + 1
+        self.sync_interval = sync_interval
+        self._buckets = {}
+        self._synced_at = None
+        self._next_sync = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _local_contains(self, digest):
+        current = int(time.time() // 3600)
+        with self._lock:
+            for hour in list(self._buckets):
+                if hour <= current - self.buckets_kept:
+                    del self._buckets[hour]
+            return any(digest in bucket for bucket in self._buckets.values())
+
+    def _local_add(self, digest, hour=None):
+        if hour is None:
+            hour = int(time.time() // 3600)
+        with self._lock:
+            self._buckets.setdefault(hour, set()).add(digest)
+
+    def sync(self):
+        """ Load the digests stored by any process since the last sync """
+        with self._sync_lock:
+            if time.monotonic() < self._next_sync:
+                return
+            started = timezone.now()
+            if self._synced_at is None:
+                since = started - timedelta(hours=self.buckets_kept)
+            else:
+                since = self._synced_at - timedelta(seconds=self.SYNC_OVERLAP)
+            rows = SessionReplay.objects.filter(datetime__gte=since).values_list('digest', 'datetime')
+            for digest, stored in rows.iterator():
+                self._local_add(digest, int(stored.timestamp() // 3600))
+            self._synced_at = started
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def seen(self, token):
+        """ True if the token has already been stored """
+        digest = self._digest(token)
+        if self._local_contains(digest):
+            return True
+
+        try:
+            self.sync()
+        except Exception as exception:
+            logger.error("Replay window sync failed: %s" % exception)
+            return SessionReplay.objects.filter(digest=digest).exists()
+        return self._local_contains(digest)
+
+    def add(self, token):
+        """ Store the token, False if it was already there """
+        digest = self._digest(token)
+        if self._local_contains(digest):
+            return False
+
+        try:
+            # Savepoint: a duplicate must not break the caller transaction
+            with transaction.atomic():
+                SessionReplay.objects.create(digest=digest)
+        except IntegrityError:
+            logger.debug("Session replayed from another process")
+            self._local_add(digest)
+            return False
+        self._local_add(digest)
+        return True
+
+
+replay_window = ReplayWindow()
@@ -0,0 +1,69 @@
+"""
+    iCarusi BE - TvShow title/media search index
+"""
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from StiCazzi.models import TvShow, TvShowSearchToken
+
+# A full match on the title weighs more than one on the media
+FIELD_WEIGHTS = {'t': 2, 'm': 1}
+
+
+def normalize(text):
+    return ' '.join(str(text).lower().split())
+
+
+def trigrams(text):
+    """ Set of the 3 chars tokens of a text """
+    text = normalize(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def index_tvshows(tvshows):
+    """ (Re)build the search tokens of the shows """
+    tokens = []
+    for tvs in tvshows:
+        for field, text in (('t', tvs.title), ('m', tvs.media)):
+            tokens += [TvShowSearchToken(tvshow_id=tvs.id_tv_show, field=field, token=token)
+                       for token in trigrams(text)]
+
+    with transaction.atomic():
+        TvShowSearchToken.objects.filter(tvshow__in=[tvs.id_tv_show for tvs in tvshows]).delete()
+        TvShowSearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+def substring_match(query):
+    return Q(title__icontains=query) | Q(media__icontains=query)
+
+
+def search_tvshow_ids(query):
+    """
+    Ids of the shows whose title or media contains the query, best matches first.
+    Candidates come from the token index, the substring match is then checked on
+    the candidates only, so results are the same of an icontains scan.
+    """
+    grams = trigrams(query)
+    if not grams:
+        # Under 3 chars once the whitespace is collapsed: nothing to look up
+        return list(TvShow.objects.filter(substring_match(query))
+                                  .order_by('-created', '-id_tv_show')
+                                  .values_list('id_tv_show', flat=True))
+
+    matches = TvShowSearchToken.objects.filter(token__in=grams)\
+                                       .values('tvshow', 'field')\
+                                       .annotate(hits=Count('token', distinct=True))\
+                                       .filter(hits=len(grams))
+    scores = {}
+    for rec in matches:
+        scores[rec['tvshow']] = scores.get(rec['tvshow'], 0) + FIELD_WEIGHTS[rec['field']]
+    if not scores:
+        return []
+
+    found = TvShow.objects.filter(id_tv_show__in=scores.keys())\
+                          .filter(substring_match(query))\
+                          .order_by('-created', '-id_tv_show')\
+                          .values_list('id_tv_show', flat=True)
+    # sorted() is stable: same score keeps the newest first
+    return sorted(found, key=lambda id_tv_show: -scores[id_tv_show])
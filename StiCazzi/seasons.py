@@ -0,0 +1,58 @@
+"""
+    iCarusi BE - Series season cloning
+"""
+
+import logging
+
+from django.db import connection, transaction
+
+from StiCazzi.models import TvShow, TvShowVote, User
+from StiCazzi import search, stats
+from StiCazzi.generation import catalogue_generation
+
+logger = logging.getLogger(__name__)
+
+CLONED_FIELDS = ('title', 'media', 'type', 'tvshow_type', 'director', 'year', 'miniseries', 'vote', 'user_id')
+
+
+@transaction.atomic
+def clone_seasons(tvshow, count, copy_poster=False, copy_link=True, owner_vote=None):
+    """
+    Add count seasons after tvshow with one bulk insert.
+    owner_vote: vote of the owner on tvshow, copied (vote and now watching) to every new season.
+    Return the new shows.
+    """
+    # Clones by the same owner are serialized: the newest matching rows read back below are ours
+    list(User.objects.select_for_update().filter(pk=tvshow.user_id).values_list('pk', flat=True))
+
+    first = int(tvshow.serie_season) + 1
+    seasons = [TvShow(serie_season=season,
+                      poster=tvshow.poster if copy_poster else '',
+                      link=tvshow.link if copy_link else '',
+                      **{field: getattr(tvshow, field) for field in CLONED_FIELDS})
+               for season in range(first, first + count)]
+    TvShow.objects.bulk_create(seasons, batch_size=500)
+
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # bulk_create does not return the primary keys on MySQL: exactly the count newest matching rows
+        seasons = list(TvShow.objects.filter(id_tv_show__gt=tvshow.id_tv_show, user_id=tvshow.user_id,
+                                             title=tvshow.title, serie_season__gte=first,
+                                             serie_season__lt=first + count)
+                                     .order_by('-id_tv_show')[:len(seasons)])[::-1]
+    logger.debug("Cloned %s seasons of %s" % (len(seasons), tvshow.title))
+
+    # bulk_create sends no signals: derived data is updated here
+    search.index_tvshows(seasons)
+    stats.bump_tvshow_type(tvshow.tvshow_type, len(seasons))
+
+    if owner_vote is not None:
+        TvShowVote.objects.bulk_create([
+            TvShowVote(user_id=owner_vote.user_id, tvshow=season, vote=owner_vote.vote,
+                       now_watching=owner_vote.now_watching, season=season.serie_season)
+            for season in seasons
+        ], batch_size=500)
+        stats.bump_user_votes(owner_vote.user_id, len(seasons))
+        stats.refresh_tvshow_votes([season.id_tv_show for season in seasons])
+
+    catalogue_generation.bump_on_commit()
+    return seasons
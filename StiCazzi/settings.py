@@ -44,7 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'StiCazzi',
+    'StiCazzi.apps.StiCazziConfig',
     'corsheaders',
 ]
 
@@ -57,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'StiCazzi.middleware.RequestPayloadMiddleware',
 ]
 
 ROOT_URLCONF = 'StiCazzi.urls'
@@ -109,6 +110,31 @@ DATABASES = {
 
 
 
+# Caches
+# "shared" is a file based cache, visible to every mod_wsgi process of the host,
+# holding the data generations only (a handful of keys, never culled).
+# "pages" holds the generation keyed response payloads, in its own directory so
+# its culling never evicts anything else: size it for pages x request params.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('STICAZZI_SHARED_CACHE_DIR', '/tmp/sticazzi_cache'),
+        'TIMEOUT': None,
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('STICAZZI_PAGE_CACHE_DIR', '/tmp/sticazzi_page_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('STICAZZI_PAGE_CACHE_ENTRIES', 5000)),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -127,6 +153,18 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Human passwords keep the default (slow) hasher, rosebud_hmac is used for the
+# random rosebud_uid tokens only (see StiCazzi.hashers)
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'StiCazzi.hashers.RosebudTokenHasher',
+]
+
+ROSEBUD_TOKEN_KEY = os.environ.get('ROSEBUD_TOKEN_KEY', SECRET_KEY)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.11/topics/i18n/
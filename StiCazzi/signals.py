@@ -0,0 +1,115 @@
+"""
+    iCarusi BE - Signal handlers keeping the derived data in sync
+"""
+
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from StiCazzi.models import TvShow, TvShowVote, Like, Configuration, Catalogue, Movie
+from StiCazzi import search, stats
+from StiCazzi.generation import configuration_generation, media_catalogue_generation, movie_generation
+
+
+SEARCH_FIELDS = ('title', 'media')
+
+
+def search_values(instance):
+    # Loaded fields only: deferred ones are neither saved nor indexed
+    return {field: instance.__dict__[field] for field in SEARCH_FIELDS if field in instance.__dict__}
+
+
+@receiver(post_init, sender=TvShow, dispatch_uid='tvshow_search_init')
+def tvshow_loaded_search(sender, instance, **kwargs):
+    instance._search_values = search_values(instance)
+
+
+@receiver(post_save, sender=TvShow, dispatch_uid='tvshow_search_index')
+def tvshow_saved_search(sender, instance, created, update_fields=None, **kwargs):
+    """ Keep the search index in sync, tokens are removed by cascade on delete """
+    if update_fields and not set(SEARCH_FIELDS) & set(update_fields):
+        return
+    values = search_values(instance)
+    if not created and values == instance._search_values:
+        return
+    search.index_tvshows([instance])
+    instance._search_values = values
+
+
+@receiver(post_init, sender=TvShow, dispatch_uid='tvshow_stat_init')
+def tvshow_loaded(sender, instance, **kwargs):
+    # Counted type, to move the counter when the type changes.
+    # __dict__ does not trigger a query for deferred fields
+    instance._stat_tvshow_type = instance.__dict__.get('tvshow_type')
+
+
+@receiver(post_save, sender=TvShow, dispatch_uid='tvshow_stat_save')
+def tvshow_saved_stat(sender, instance, created, **kwargs):
+    if created:
+        stats.bump_tvshow_type(instance.tvshow_type, 1)
+    elif instance._stat_tvshow_type is not None and instance.tvshow_type != instance._stat_tvshow_type:
+        stats.bump_tvshow_type(instance._stat_tvshow_type or instance.tvshow_type, -1)
+        stats.bump_tvshow_type(instance.tvshow_type, 1)
+    instance._stat_tvshow_type = instance.tvshow_type
+
+
+@receiver(post_delete, sender=TvShow, dispatch_uid='tvshow_stat_delete')
+def tvshow_deleted_stat(sender, instance, **kwargs):
+    stats.bump_tvshow_type(instance._stat_tvshow_type or instance.tvshow_type, -1)
+
+
+@receiver(post_init, sender=TvShowVote, dispatch_uid='vote_stat_init')
+def vote_loaded(sender, instance, **kwargs):
+    instance._stat_user_id = instance.__dict__.get('user_id')
+
+
+@receiver(post_save, sender=TvShowVote, dispatch_uid='vote_avg_save')
+@receiver(post_delete, sender=TvShowVote, dispatch_uid='vote_avg_delete')
+def vote_changed_avg(sender, instance, **kwargs):
+    stats.refresh_tvshow_votes([instance.tvshow_id])
+
+
+@receiver(post_save, sender=TvShowVote, dispatch_uid='vote_stat_save')
+def vote_saved_stat(sender, instance, created, **kwargs):
+    if created:
+        stats.bump_user_votes(instance.user_id, 1)
+    elif instance._stat_user_id is not None and instance.user_id != instance._stat_user_id:
+        stats.bump_user_votes(instance._stat_user_id or instance.user_id, -1)
+        stats.bump_user_votes(instance.user_id, 1)
+    instance._stat_user_id = instance.user_id
+
+
+@receiver(post_delete, sender=TvShowVote, dispatch_uid='vote_stat_delete')
+def vote_deleted_stat(sender, instance, **kwargs):
+    stats.bump_user_votes(instance._stat_user_id or instance.user_id, -1)
+
+
+@receiver(post_init, sender=Like, dispatch_uid='like_count_init')
+def like_loaded(sender, instance, **kwargs):
+    instance._counted_vote_id = instance.__dict__.get('id_vote_id')
+
+
+@receiver(post_save, sender=Like, dispatch_uid='like_count_save')
+@receiver(post_delete, sender=Like, dispatch_uid='like_count_delete')
+def like_changed(sender, instance, **kwargs):
+    vote_ids = {instance.id_vote_id, instance._counted_vote_id} - {None}
+    if vote_ids:
+        stats.refresh_like_counts(vote_ids)
+    instance._counted_vote_id = instance.id_vote_id
+
+
+@receiver(post_save, sender=Configuration, dispatch_uid='configuration_save_generation')
+@receiver(post_delete, sender=Configuration, dispatch_uid='configuration_delete_generation')
+def configuration_changed(sender, **kwargs):
+    configuration_generation.bump_on_commit()
+
+
+@receiver(post_save, sender=Catalogue, dispatch_uid='catalogue_save_generation')
+@receiver(post_delete, sender=Catalogue, dispatch_uid='catalogue_delete_generation')
+def media_catalogue_changed(sender, **kwargs):
+    media_catalogue_generation.bump_on_commit()
+
+
+@receiver(post_save, sender=Movie, dispatch_uid='movie_save_generation')
+@receiver(post_delete, sender=Movie, dispatch_uid='movie_delete_generation')
+def movie_changed(sender, **kwargs):
+    movie_generation.bump_on_commit()
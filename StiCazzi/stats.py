@@ -0,0 +1,95 @@
+"""
+    iCarusi BE - Counter tables behind tvshow_stat and votes_user
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from StiCazzi.models import TvShow, TvShowVote, TvShowStat, UserVoteStat, Like
+
+
+def _bump(model, lookup, delta):
+    """ Add delta to the counter row, creating it if needed """
+    if model.objects.filter(**lookup).update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(count=delta, **lookup)
+    except IntegrityError:
+        # Created in the meantime by a concurrent request
+        model.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+def bump_tvshow_type(tvshow_type, delta):
+    _bump(TvShowStat, {'tvshow_type': tvshow_type}, delta)
+
+
+def bump_user_votes(user_id, delta):
+    _bump(UserVoteStat, {'user_id': user_id}, delta)
+
+
+def tvshow_stat():
+    """ Number of shows by type """
+    stat = dict(TvShowStat.objects.values_list('tvshow_type', 'count'))
+    return {'movie': stat.get('movie', 0), 'serie': stat.get('serie', 0)}
+
+
+def tvshow_total():
+    """ Number of shows """
+    return TvShowStat.objects.aggregate(total=Sum('count'))['total'] or 0
+
+
+def votes_user():
+    """ Number of votes by user, most active first """
+    stats = UserVoteStat.objects.filter(count__gt=0)\
+                                .order_by('-count')\
+                                .values_list('user__username', 'count')
+    return [{"name": name, "count": count} for name, count in stats]
+
+
+def refresh_tvshow_votes(tvshow_ids=None):
+    """ Recompute avg_vote/vote_count of the shows (all of them if None) with a single UPDATE """
+    completed = TvShowVote.objects.filter(tvshow=OuterRef('pk'), now_watching=False)\
+                                  .order_by()\
+                                  .values('tvshow')
+    tvshows = TvShow.objects.all()
+    if tvshow_ids is not None:
+        tvshows = tvshows.filter(id_tv_show__in=tvshow_ids)
+    tvshows.update(
+        avg_vote=Coalesce(Subquery(completed.annotate(avg=Avg('vote')).values('avg')), Value(0),
+                          output_field=DecimalField(max_digits=6, decimal_places=4)),
+        vote_count=Coalesce(Subquery(completed.annotate(count=Count('id_vote')).values('count')), Value(0))
+    )
+
+
+def refresh_like_counts(vote_ids=None):
+    """ Recompute like_count of the votes (all of them if None) with a single UPDATE """
+    likes = Like.objects.filter(id_vote=OuterRef('pk'), reaction='*')\
+                        .order_by()\
+                        .values('id_vote')\
+                        .annotate(count=Count('id_like'))\
+                        .values('count')
+    votes = TvShowVote.objects.all()
+    if vote_ids is not None:
+        votes = votes.filter(id_vote__in=vote_ids)
+    votes.update(like_count=Coalesce(Subquery(likes), Value(0)))
+
+
+@transaction.atomic
+def rebuild_stats():
+    """ Recompute every counter from the TvShow and TvShowVote tables """
+    TvShowStat.objects.all().delete()
+    TvShowStat.objects.bulk_create([
+        TvShowStat(tvshow_type=rec['tvshow_type'], count=rec['count'])
+        for rec in TvShow.objects.values('tvshow_type').annotate(count=Count('id_tv_show')).order_by()
+    ])
+
+    UserVoteStat.objects.all().delete()
+    UserVoteStat.objects.bulk_create([
+        UserVoteStat(user_id=rec['user'], count=rec['count'])
+        for rec in TvShowVote.objects.values('user').annotate(count=Count('id_vote')).order_by()
+    ])
+
+    refresh_tvshow_votes()
+    refresh_like_counts()
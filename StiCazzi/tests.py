@@ -0,0 +1,550 @@
+"""
+    iCarusi BE - Tests
+"""
+
+import base64
+import decimal
+import json
+import glob
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from datetime import datetime, timedelta
+from unittest import mock
+
+from Crypto.Cipher import AES
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth import crypt, jwt
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import Q, QuerySet
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.utils import timezone
+
+from StiCazzi import controllers, movies_controllers, search
+from StiCazzi.replay import ReplayWindow
+from StiCazzi.id_tokens import GOOGLE_ISSUERS, HttpKeySource, IdTokenVerifier, KeyStore, StaticKeySource
+from StiCazzi.notifications import LogTransport, dispatch_batch, drop_stale, MULTICAST_SIZE
+from StiCazzi.models import User, TvShow, TvShowVote, Like, Notification, UserVoteStat, Session, SessionReplay
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+    'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages'},
+}
+
+# getTvShows3 queries, whatever the page size and the number of votes:
+# shows, votes of the shows, now watching shows (page 1), type stats, user votes, total
+PAGE_QUERIES = 5
+FIRST_PAGE_QUERIES = 6
+
+
+@override_settings(CACHES=TEST_CACHES)
+@mock.patch.object(movies_controllers, 'check_request_session', return_value=True)
+class TvShowListingQueryBudgetTest(TestCase):
+    """ getTvShows3 must build a page with a constant number of queries """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create(username='user%d' % i, name='Name %d' % i, surname='Surname',
+                                     birth_date='2000-01-01') for i in range(4)]
+        now = timezone.now()
+        for i in range(40):
+            tvshow = TvShow.objects.create(title='Show %d' % i, media='netflix', user=users[i % 4],
+                                           tvshow_type='serie' if i % 2 else 'movie', vote=5)
+            TvShow.objects.filter(pk=tvshow.pk).update(created=now - timedelta(minutes=i))
+            for j, user in enumerate(users[:i % 4 + 1]):
+                vote = TvShowVote.objects.create(user=user, tvshow=tvshow, vote=6 + j, comment='comment %d' % j,
+                                                 now_watching=i % 9 == 0)
+                for liker in users[:j]:
+                    Like.objects.create(user=liker, id_vote=vote, reaction='*')
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        self.factory = RequestFactory()
+
+    def get_tvshows(self, **data):
+        data.update({'username': 'user0', 'kanazzi': 'session'})
+        request = self.factory.post('/getTvShows3', data=json.dumps(data), content_type='application/json')
+        response = movies_controllers.get_tvshows_new_opt(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['payload']
+
+    def test_first_page(self, _):
+        with self.assertNumQueries(FIRST_PAGE_QUERIES):
+            payload = self.get_tvshows(limit=15)
+        self.assertTrue(payload['has_more'])
+        self.assertTrue(any(tvshow['u_v_dict'] for tvshow in payload['tvshows']))
+
+    def test_budget_does_not_depend_on_page_size(self, _):
+        for limit in (5, 30):
+            with self.assertNumQueries(PAGE_QUERIES):
+                self.get_tvshows(limit=limit, current_page=2)
+
+    def test_cursor_pages(self, _):
+        with self.assertNumQueries(FIRST_PAGE_QUERIES):
+            payload = self.get_tvshows(limit=10, cursor='')
+        with self.assertNumQueries(PAGE_QUERIES):
+            payload = self.get_tvshows(limit=10, cursor=payload['next_cursor'])
+        self.assertEqual(len(payload['tvshows']), 10)
+
+    def test_cached_page(self, _):
+        self.get_tvshows(limit=15, current_page=2)
+        with self.assertNumQueries(0):
+            self.get_tvshows(limit=15, current_page=2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+@mock.patch.object(movies_controllers, 'check_request_session', return_value=True)
+class SaveMovieVoteTest(TestCase):
+    """ Votes sent through savemovienew keep the vote aggregates of the show """
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner', name='Owner', surname='S', birth_date='2000-01-01')
+        self.other = User.objects.create(username='other', name='Other', surname='S', birth_date='2000-01-01')
+        self.factory = RequestFactory()
+
+    def save_movie(self, username, **data):
+        data = dict({'title': 'Dark', 'media': 'netflix', 'tvshow_type': 'movie', 'year': 2017}, **data)
+        data.update({'username': username, 'kanazzi': 'session'})
+        request = self.factory.post('/savemovienew', data=json.dumps(data), content_type='application/json')
+        response = movies_controllers.savemovienew(request)
+        self.assertEqual(response.status_code, 200)
+
+    def test_non_owner_vote(self, _):
+        self.save_movie('owner', id=0, vote='4')
+        tvshow = TvShow.objects.get(title='Dark')
+        self.save_movie('other', id=tvshow.id_tv_show, vote='10', media='prime')
+
+        tvshow.refresh_from_db()
+        self.assertEqual(tvshow.vote_count, 2)
+        self.assertEqual(tvshow.avg_vote, 7)
+        self.assertEqual(tvshow.media, 'prime')
+
+    def test_owner_edit(self, _):
+        self.save_movie('owner', id=0, vote='4')
+        tvshow = TvShow.objects.get(title='Dark')
+        self.save_movie('other', id=tvshow.id_tv_show, vote='10')
+        self.save_movie('owner', id=tvshow.id_tv_show, vote='6', director='Odar')
+
+        tvshow.refresh_from_db()
+        self.assertEqual((tvshow.vote_count, tvshow.avg_vote, tvshow.director), (2, 8, 'Odar'))
+
+
+SESSION_KEY = 'k' * 16
+
+
+def session_string(session_dt):
+    """ kanazzi as made by the app: the encrypted timestamp """
+    plain_text = session_dt.strftime("%Y_%m_%d_%H_%M_%S_%f").encode('utf-8')
+    plain_text += b' ' * (-len(plain_text) % 16)
+    return base64.b64encode(AES.new(SESSION_KEY, AES.MODE_ECB).encrypt(plain_text)).decode('ascii')
+
+
+@mock.patch.dict(os.environ, {'OPENSHIFT_DUMMY_KEY': SESSION_KEY})
+class CheckSessionTest(TestCase):
+    """ Session strings are valid once, inside the validity window """
+
+    def setUp(self):
+        patcher = mock.patch.object(controllers, 'replay_window', ReplayWindow(sync_interval=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_replay(self):
+        session_id = session_string(datetime.now())
+        self.assertTrue(controllers.check_session(session_id, 'user0'))
+        self.assertTrue(controllers.check_session(session_id, 'user0', store=True))
+        self.assertFalse(controllers.check_session(session_id, 'user0', store=True))
+        self.assertFalse(controllers.check_session(session_id, 'user0'))
+
+    def test_replay_from_another_process(self):
+        session_id = session_string(datetime.now())
+        self.assertTrue(controllers.check_session(session_id, 'user0', store=True))
+        with mock.patch.object(controllers, 'replay_window', ReplayWindow(sync_interval=0)):
+            self.assertFalse(controllers.check_session(session_id, 'user0'))
+        with mock.patch.object(controllers, 'replay_window', ReplayWindow(sync_interval=3600)):
+            self.assertFalse(controllers.check_session(session_id, 'user0', store=True))
+
+    def test_expired_and_future(self):
+        self.assertFalse(controllers.check_session(session_string(datetime.now() - timedelta(hours=4)), 'user0'))
+        self.assertTrue(controllers.check_session(session_string(datetime.now() + timedelta(minutes=50)), 'user0'))
+        self.assertFalse(controllers.check_session(session_string(datetime.now() + timedelta(hours=2)), 'user0'))
+
+
+class PruneSessionsTest(TestCase):
+    """ prune_sessions archives the Session audit rows it deletes """
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        old = timezone.now() - timedelta(days=2)
+        for i in range(3):
+            Session.objects.create(session_string='s%d' % i, username='user', action='login')
+            SessionReplay.objects.create(digest='%064d' % i)
+        Session.objects.filter(session_string__in=['s0', 's1']).update(datetime=old)
+        SessionReplay.objects.update(datetime=old)
+
+    def test_prune_then_restore(self):
+        call_command('prune_sessions', '--dir', self.archive_dir, '--pause', '0', stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_string', flat=True)), ['s2'])
+        self.assertFalse(SessionReplay.objects.exists())
+
+        parts = glob.glob(os.path.join(self.archive_dir, 'sessions', '*.ndjson.gz'))
+        call_command('restore_archive', *parts, stdout=StringIO())
+        self.assertEqual(sorted(Session.objects.values_list('session_string', flat=True)), ['s0', 's1', 's2'])
+
+    def test_no_archive(self):
+        call_command('prune_sessions', '--dir', self.archive_dir, '--no-archive', '--pause', '0', stdout=StringIO())
+        self.assertEqual(Session.objects.count(), 1)
+        self.assertFalse(glob.glob(os.path.join(self.archive_dir, 'sessions', '*')))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VoteUpsertTest(TestCase):
+    """ create_update_vote writes a single vote per (user, tvshow) """
+
+    def setUp(self):
+        self.user = User.objects.create(username='voter', name='Voter', surname='S', birth_date='2000-01-01')
+        self.tvshow = TvShow.objects.create(title='Dark', media='netflix', user=self.user)
+
+    def vote(self, **vote_dict):
+        vote_dict = dict({'vote': 7, 'nw': False, 'season': 1, 'episode': 1, 'comment': '', 'giveup': False},
+                         **vote_dict)
+        movies_controllers.create_update_vote(self.user, [self.tvshow], vote_dict)
+
+    def test_insert_then_update(self):
+        self.vote(vote=6, like='*')
+        self.vote(vote=8, comment='great', like='+')
+
+        vote = TvShowVote.objects.get(user=self.user, tvshow=self.tvshow)
+        self.assertEqual((vote.vote, vote.comment), (8, 'great'))
+        # One like on the vote, no stray Like rows
+        self.assertEqual(list(Like.objects.values_list('id_vote', 'reaction')), [(vote.id_vote, '+')])
+        self.assertEqual(Notification.objects.filter(type='new_comment').count(), 1)
+
+        self.vote(giveup=True)
+        self.assertFalse(TvShowVote.objects.exists())
+        self.assertFalse(Like.objects.exists())
+
+    def test_vote_inserted_concurrently(self):
+        self.vote(vote=6)
+        # The vote is not found by the first read, as if inserted meanwhile by another request
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            self.vote(vote=9)
+        self.assertEqual(list(TvShowVote.objects.values_list('vote', flat=True)), [9])
+
+    def test_deadlock_retry(self):
+        calls = []
+
+        def transaction_body():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError(movies_controllers.DEADLOCK_ERROR, 'Deadlock found')
+            return 'done'
+
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(movies_controllers.retry_on_deadlock(transaction_body), 'done')
+        self.assertEqual(len(calls), 2)
+        # Inside an outer transaction the error goes up
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            movies_controllers.retry_on_deadlock(transaction_body)
+
+
+class SearchIndexTest(TestCase):
+    """ Searches on the token index give the shows of an icontains scan """
+
+    TITLES = (('Dark', 'netflix'), ('The Office', 'prime video'), ('the  office (UK)', 'bbc'),
+              ('Darkwing Duck', 'disney+'), ('Ab Ovo', 'raiplay'), ('Kebab  ab  ba', 'youtube'),
+              ('Star Trek: TNG', 'paramount'))
+
+    def setUp(self):
+        self.user = User.objects.create(username='searcher', name='S', surname='S', birth_date='2000-01-01')
+        for title, media in self.TITLES:
+            TvShow.objects.create(title=title, media=media, user=self.user)
+
+    def test_same_as_icontains(self):
+        for query in ('dark', 'DARK', 'the office', 'the  office', '  ab  ', ' ab ', ' ab', 'ab o', 'flix',
+                      'prime vid', 'k: t', '(uk)', 'dis', 'zzzz', 'e o'):
+            expected = TvShow.objects.filter(Q(title__icontains=query) | Q(media__icontains=query))
+            self.assertEqual(set(search.search_tvshow_ids(query)),
+                             set(expected.values_list('id_tv_show', flat=True)), query)
+
+    def test_title_before_media(self):
+        found = search.search_tvshow_ids('dark')
+        self.assertEqual(TvShow.objects.get(id_tv_show=found[0]).title, 'Darkwing Duck')
+        self.assertEqual(len(found), 2)
+
+    def test_reindex_on_change_only(self):
+        tvshow = TvShow.objects.get(title='Dark')
+        with mock.patch.object(search, 'index_tvshows', wraps=search.index_tvshows) as index_tvshows:
+            tvshow.save()
+            tvshow.tvshow_type = 'series'
+            tvshow.save()
+            self.assertFalse(index_tvshows.called)
+
+            tvshow.title = 'Dark Matter'
+            tvshow.save()
+            tvshow.save()
+            self.assertEqual(index_tvshows.call_count, 1)
+        self.assertEqual(search.search_tvshow_ids('matter'), [tvshow.id_tv_show])
+
+
+@override_settings(CACHES=TEST_CACHES)
+@mock.patch.object(movies_controllers, 'check_request_session', return_value=True)
+class BatchVotesTest(TestCase):
+    """ batchvotes applies the operations in order, in one transaction """
+
+    def setUp(self):
+        self.voter = User.objects.create(username='voter', name='Voter', surname='S', birth_date='2000-01-01')
+        self.author = User.objects.create(username='author', name='Author', surname='S', birth_date='2000-01-01')
+        self.first, self.second = [TvShow.objects.create(title=title, media='netflix', user=self.author)
+                                   for title in ('Dark', 'Lost')]
+        self.author_vote = TvShowVote.objects.create(user=self.author, tvshow=self.first, vote=6, comment='meh')
+        self.factory = RequestFactory()
+
+    def batch(self, operations, status=200):
+        data = {'username': 'voter', 'kanazzi': 'session', 'operations': operations}
+        request = self.factory.post('/batchvotes', data=json.dumps(data), content_type='application/json')
+        response = movies_controllers.batch_votes(request)
+        self.assertEqual(response.status_code, status)
+        return json.loads(response.content)
+
+    def test_operations_in_order(self, _):
+        self.batch([
+            {'op': 'nw', 'tvshow': self.first.id_tv_show, 'episode': 1},
+            {'op': 'vote', 'tvshow': self.first.id_tv_show, 'vote': 8, 'comment': 'great'},
+            {'op': 'vote', 'tvshow': self.second.id_tv_show, 'vote': 6},
+            {'op': 'vote', 'tvshow': self.second.id_tv_show, 'giveup': True},
+            {'op': 'vote', 'tvshow': self.second.id_tv_show, 'vote': '7.5'},
+        ])
+
+        votes = {vote.tvshow_id: vote for vote in TvShowVote.objects.filter(user=self.voter)}
+        self.assertEqual((votes[self.first.id_tv_show].vote, votes[self.first.id_tv_show].now_watching,
+                          votes[self.first.id_tv_show].comment), (8, False, 'great'))
+        self.assertEqual(votes[self.second.id_tv_show].vote, decimal.Decimal('7.5'))
+        self.assertEqual(list(Notification.objects.order_by('id_notification').values_list('type', flat=True)),
+                         ['new_nw', 'new_vote', 'new_comment', 'new_vote', 'give_up', 'new_vote'])
+
+        # Counters and vote aggregates, as rebuild_stats would compute them
+        self.assertEqual(UserVoteStat.objects.get(user=self.voter).count, 2)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.avg_vote, self.first.vote_count), (7, 2))
+        self.assertEqual((self.second.avg_vote, self.second.vote_count), (decimal.Decimal('7.5'), 1))
+
+    def test_likes(self, _):
+        id_vote = self.author_vote.id_vote
+        self.batch([
+            {'op': 'like', 'id_vote': id_vote, 'reaction': '*'},
+            {'op': 'like', 'id_vote': id_vote, 'reaction': '+'},
+        ])
+        self.assertEqual(list(Like.objects.values_list('id_vote', 'user', 'reaction')),
+                         [(id_vote, self.voter.id_user, '+')])
+        self.author_vote.refresh_from_db()
+        self.assertEqual(self.author_vote.like_count, 0)
+        # Both likes coalesced in a single notification to the author
+        self.assertEqual(list(Notification.objects.values_list('type', 'message')), [('like', 'author')])
+
+        self.batch([{'op': 'like', 'id_vote': id_vote, 'reaction': '*'}])
+        self.author_vote.refresh_from_db()
+        self.assertEqual(self.author_vote.like_count, 1)
+
+    def test_like_on_given_up_vote(self, _):
+        own_vote = TvShowVote.objects.create(user=self.voter, tvshow=self.second, vote=5)
+        self.batch([
+            {'op': 'like', 'id_vote': own_vote.id_vote, 'reaction': '*'},
+            {'op': 'vote', 'tvshow': self.first.id_tv_show, 'vote': 9, 'like': '*'},
+            {'op': 'vote', 'tvshow': self.second.id_tv_show, 'giveup': True},
+            {'op': 'vote', 'tvshow': self.first.id_tv_show, 'giveup': True},
+        ])
+        self.assertFalse(TvShowVote.objects.filter(user=self.voter).exists())
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(UserVoteStat.objects.get(user=self.voter).count, 0)
+
+    def test_bad_fields(self, _):
+        for operation in ({'op': 'vote', 'tvshow': self.first.id_tv_show, 'vote': 'great'},
+                          {'op': 'vote', 'tvshow': self.first.id_tv_show, 'vote': 'NaN'},
+                          {'op': 'vote', 'tvshow': self.first.id_tv_show, 'season': -1},
+                          {'op': 'vote', 'tvshow': self.first.id_tv_show, 'comment': 12},
+                          {'op': 'like', 'id_vote': self.author_vote.id_vote, 'reaction': ['*']}):
+            self.assertEqual(self.batch([operation], status=400)['message'], 'Bad input format')
+        self.assertFalse(TvShowVote.objects.filter(user=self.voter).exists())
+
+
+class ClaimCheckTransport(LogTransport):
+    """ LogTransport checking that the notification is claimed before it is sent """
+
+    def send(self, tokens, title, body, data):
+        assert not Notification.objects.filter(title=title, sent=False).exists()
+        return super().send(tokens, title, body, data)
+
+
+class NotificationDispatchTest(TestCase):
+    """ The dispatcher with a stub transport in place of FCM """
+
+    def setUp(self):
+        self.users = [User.objects.create(username='user%d' % i, name='N', surname='S', birth_date='2000-01-01',
+                                          fcm_token='token%d' % i) for i in range(3)]
+        self.transport = ClaimCheckTransport()
+
+    def notify(self, notification_type, title, message='', username='user0', age=None):
+        notification = Notification.objects.create(type=notification_type, title=title, message=message,
+                                                   username=username)
+        if age is not None:
+            Notification.objects.filter(pk=notification.pk).update(created=timezone.now() - age)
+        return notification
+
+    def test_recipients(self):
+        self.notify('like', 'like', message='user1', username='user2')
+        self.notify('new_vote', 'vote', username='user1')
+        self.assertEqual(dispatch_batch(self.transport), (2, 3))
+
+        sent = {title: tokens for tokens, title, body, data in self.transport.sent}
+        # A like goes to the vote author only, anything else to everybody but the actor
+        self.assertEqual(sent, {'like': ('token1',), 'vote': ('token0', 'token2')})
+        self.assertFalse(Notification.objects.filter(sent=False).exists())
+        self.assertEqual(dispatch_batch(self.transport), (0, 0))
+
+    def test_batch_size(self):
+        for i in range(5):
+            self.notify('new_vote', 'vote%d' % i)
+        self.assertEqual(dispatch_batch(self.transport, batch_size=2)[0], 2)
+        self.assertEqual(Notification.objects.filter(sent=False).count(), 3)
+
+    def test_multicast_split(self):
+        User.objects.bulk_create([User(username='many%d' % i, name='N', surname='S', birth_date='2000-01-01',
+                                       fcm_token='many%d' % i) for i in range(MULTICAST_SIZE * 2)])
+        self.notify('new_vote', 'vote')
+        self.assertEqual(dispatch_batch(self.transport), (1, MULTICAST_SIZE * 2 + 2))
+        self.assertEqual([len(tokens) for tokens, title, body, data in self.transport.sent],
+                         [MULTICAST_SIZE, MULTICAST_SIZE, 2])
+
+    def test_stale_notifications(self):
+        self.notify('new_vote', 'old', age=timedelta(days=2))
+        self.notify('new_vote', 'recent', age=timedelta(minutes=5))
+
+        # Not claimed, then dropped without being sent
+        self.assertEqual(dispatch_batch(self.transport, max_age=3600), (1, 2))
+        self.assertEqual(drop_stale(3600), 1)
+        self.assertFalse(Notification.objects.filter(sent=False).exists())
+        self.assertEqual([title for tokens, title, body, data in self.transport.sent], ['recent'])
+
+    def test_command_max_age(self):
+        self.notify('new_vote', 'old', age=timedelta(hours=3))
+        self.notify('new_vote', 'recent')
+        out = StringIO()
+        with mock.patch.dict('StiCazzi.notifications.TRANSPORTS', {'log': lambda: self.transport}):
+            call_command('dispatch_notifications', transport='log', once=True, max_age=7200, stdout=out)
+        self.assertIn('Dropped 1 notifications', out.getvalue())
+        self.assertEqual([title for tokens, title, body, data in self.transport.sent], ['recent'])
+
+
+class SigningKey:
+    """ Local RSA key pair signing ID tokens as Google would """
+
+    def __init__(self, key_id):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                        serialization.NoEncryption()).decode('ascii')
+        self.key_id = key_id
+        self.public_pem = key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                        serialization.PublicFormat.SubjectPublicKeyInfo)\
+                                         .decode('ascii')
+        self.signer = crypt.RSASigner.from_string(private_pem, key_id)
+
+    def token(self, **claims):
+        now = int(time.time())
+        claims = dict({'iss': 'accounts.google.com', 'sub': '42', 'aud': 'icarusi', 'iat': now, 'exp': now + 600},
+                      **claims)
+        return jwt.encode(self.signer, claims).decode('ascii')
+
+
+class CountingKeySource(StaticKeySource):
+    """ StaticKeySource counting the fetches """
+
+    def __init__(self, certs, max_age=300):
+        super().__init__(certs, max_age)
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        return super().fetch()
+
+
+class IdTokenVerifierTest(SimpleTestCase):
+    """ ID token verification against a local key source """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = SigningKey('key1')
+        cls.rotated_key = SigningKey('key2')
+
+    def verifier(self, certs=None, audience=None, issuers=GOOGLE_ISSUERS):
+        self.source = CountingKeySource(certs or {self.key.key_id: self.key.public_pem})
+        return IdTokenVerifier(KeyStore(self.source), issuers, audience=audience)
+
+    def test_claims_cached_until_expiration(self):
+        verifier = self.verifier()
+        token = self.key.token()
+        with mock.patch('StiCazzi.id_tokens.jwt.decode', wraps=jwt.decode) as decode:
+            self.assertEqual(verifier.verify(token)['sub'], '42')
+            self.assertEqual(verifier.verify(token)['sub'], '42')
+            self.assertEqual(decode.call_count, 1)
+
+            # Past exp the cached claims are dropped and the token is decoded again
+            with mock.patch('StiCazzi.id_tokens.time.time', return_value=time.time() + 601):
+                verifier.verify(token)
+            self.assertEqual(decode.call_count, 2)
+
+    def test_issuer_and_audience(self):
+        with self.assertRaisesRegex(ValueError, 'Wrong issuer'):
+            self.verifier().verify(self.key.token(iss='https://evil.example.com'))
+        with self.assertRaisesRegex(ValueError, 'audience'):
+            self.verifier(audience='other').verify(self.key.token())
+        self.assertEqual(self.verifier(audience='icarusi').verify(self.key.token())['aud'], 'icarusi')
+        with self.assertRaises(ValueError):
+            self.verifier().verify('')
+
+    def test_key_rotation(self):
+        verifier = self.verifier()
+        certs = self.source.certs
+        verifier.verify(self.key.token())
+        self.assertEqual(self.source.fetches, 1)
+
+        # Unknown key id right after a fetch: no refresh within MIN_REFRESH_INTERVAL
+        certs[self.rotated_key.key_id] = self.rotated_key.public_pem
+        with self.assertRaisesRegex(ValueError, 'key2'):
+            verifier.verify(self.rotated_key.token())
+        self.assertEqual(self.source.fetches, 1)
+
+        # ... later the keys are fetched again before they expire
+        later = time.monotonic() + KeyStore.MIN_REFRESH_INTERVAL
+        with mock.patch('StiCazzi.id_tokens.time.monotonic', return_value=later):
+            self.assertEqual(verifier.verify(self.rotated_key.token(sub='rotated'))['sub'], 'rotated')
+            self.assertEqual(self.source.fetches, 2)
+
+            # ... at most once per interval, however many unknown ids come in
+            with self.assertRaisesRegex(ValueError, 'key3'):
+                verifier.verify(SigningKey('key3').token())
+            self.assertEqual(self.source.fetches, 2)
+
+    def test_http_key_source_max_age(self):
+        response = mock.Mock(status_code=200, text=json.dumps({'key1': 'pem'}),
+                             headers={'Cache-Control': 'public, max-age=19745, must-revalidate, no-transform'})
+        with mock.patch('StiCazzi.id_tokens.requests.get', return_value=response):
+            self.assertEqual(HttpKeySource('http://keys').fetch(), ({'key1': 'pem'}, 19745))
+
+            response.headers = {}
+            self.assertEqual(HttpKeySource('http://keys').fetch()[1], 300)
+
+            response.status_code = 500
+            with self.assertRaises(ValueError):
+                HttpKeySource('http://keys').fetch()
@@ -41,6 +41,8 @@ urlpatterns = [
     url(r'^moviesdt/$', movies_controllers.get_movies_datatable, name='movie'),
     url(r'^moviesct/$', movies_controllers.get_movies_ct, name='movie'),
     url(r'^setlike$', movies_controllers.setlike),
+    url(r'^getlikes$', movies_controllers.get_likes),
+    url(r'^batchvotes$', movies_controllers.batch_votes),
 
     url(r'^uploadcover$', covers_controllers.save_cover),
     url(r'^getcovers$', covers_controllers.get_covers),
@@ -56,6 +58,7 @@ urlpatterns = [
 
     url(r'^geolocation$', controllers.geolocation),
     url(r'^geolocation2$', controllers.geolocation2),
+    url(r'^getfeed$', controllers.get_feed),
     url(r'^getcatalogue$', movies_controllers.get_catalogue),
 
     url(r'^login$', controllers.login),
@@ -5,6 +5,11 @@
 import json
 import decimal
 import hashlib
+import base64
+import binascii
+import datetime
+
+from django.utils.dateparse import parse_datetime
 
 
 def decimal_dumps(dec):
@@ -45,3 +50,35 @@ def safe_file_name(name, file_type):
     final_fname += "." + ext
 
     return final_fname
+
+
+def encode_cursor(*values):
+
+    """ Opaque pagination cursor from a tuple of values (datetimes allowed) """
+
+    values = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, *types):
+
+    """ Values of a cursor made by encode_cursor, converted to types. Raise ValueError if not valid """
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor).encode('ascii')).decode('utf-8'))
+    except (TypeError, UnicodeError, binascii.Error) as exception:
+        raise ValueError('Invalid cursor: %s' % exception)
+
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError('Invalid cursor')
+
+    out = []
+    for value, value_type in zip(values, types):
+        if value_type is datetime.datetime:
+            value = parse_datetime(str(value))
+            if value is None:
+                raise ValueError('Invalid cursor date')
+        else:
+            value = value_type(value)
+        out.append(value)
+    return out
@@ -0,0 +1,104 @@
+"""
+    iCarusi BE - Write-behind buffer for User updates
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.core.signals import request_finished
+from django.db import connection, transaction
+from django.utils import timezone
+
+from StiCazzi.env import WRITE_BEHIND_INTERVAL
+from StiCazzi.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class UserWriteBuffer:
+    """
+    Coalesces non critical User field changes (app version, push token...) and
+    writes them with field-only UPDATEs, at most every <interval> seconds.
+    Security critical changes (rosebud_uid rotation, id tokens) must not go
+    through here: save them synchronously with update_fields.
+    """
+
+    def __init__(self, interval=WRITE_BEHIND_INTERVAL):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        self._last_flush = time.monotonic()
+
+    def defer(self, user, **fields):
+        """ Set the fields on the instance and queue the changed ones for the next flush """
+        changed = {}
+        for field, value in fields.items():
+            if getattr(user, field) != value:
+                setattr(user, field, value)
+                changed[field] = value
+        if not changed:
+            return
+
+        if not self.interval:
+            User.objects.filter(pk=user.pk).update(updated=timezone.now(), **changed)
+            return
+
+        with self._lock:
+            self._pending.setdefault(user.pk, {}).update(changed)
+            self._schedule()
+
+    def _schedule(self):
+        # Called with the lock held
+        if self._timer is None:
+            self._timer = threading.Timer(self.interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush_if_due(self, **kwargs):
+        """ request_finished receiver """
+        if self._pending and time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+    def flush(self):
+        """ Write every pending change, one UPDATE per user, in a single transaction """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                for id_user, fields in pending.items():
+                    User.objects.filter(pk=id_user).update(updated=now, **fields)
+        except Exception as exception:
+            logger.error("User write-behind flush failed: %s" % exception)
+            with self._lock:
+                # Changes queued in the meantime are newer, they win
+                for id_user, fields in pending.items():
+                    fields.update(self._pending.get(id_user, {}))
+                    self._pending[id_user] = fields
+                self._schedule()
+            return 0
+
+        logger.debug("User write-behind: %s user(s) updated" % len(pending))
+        return len(pending)
+
+
+user_writes = UserWriteBuffer()
+request_finished.connect(user_writes.flush_if_due, dispatch_uid='user_write_behind')
+atexit.register(user_writes.flush)